@@ -1,13 +1,32 @@
+import itertools
+import uuid
+
 import requests
 
 STATE_MACHINE_URL = "http://0.0.0.0:1111/event"
 
+SENDER_ID = f"gaze_animation-{uuid.uuid4().hex[:8]}"
+REQUEST_TIMEOUT = 0.2
+RETRIES = 3
+
+sequence = itertools.count(1)
+
+
+def post_event(event_name: str):
+    payload = {"name": event_name, "sender": SENDER_ID, "seq": next(sequence)}
+    for attempt in range(RETRIES):
+        try:
+            resp = requests.post(STATE_MACHINE_URL, json=payload, timeout=REQUEST_TIMEOUT)
+            resp.raise_for_status()
+            return
+        except Exception:
+            if attempt == RETRIES - 1:
+                raise
+
 
 def notify_gaze_program_finished():
     try:
-        requests.post(
-            STATE_MACHINE_URL, json={"name": "gaze_program_finished"}, timeout=0.5
-        )
+        post_event("gaze_program_finished")
         print("Sent to state machine: gaze_program_finished")
     except Exception as e:
         print("ERROR while sending data to state_machine: ", str(e))
@@ -16,8 +35,7 @@ def notify_gaze_program_finished():
 
 def notify_keyboard_event(event_name: str):
     try:
-        resp = requests.post(STATE_MACHINE_URL, json={"name": event_name}, timeout=0.5)
-        resp.raise_for_status()
+        post_event(event_name)
         print(f"Sent to state machine: {event_name}")
     except Exception as e:
         print("ERROR while sending data to state_machine: ", str(e))
@@ -0,0 +1,64 @@
+import json
+import os
+import re
+from datetime import datetime
+from typing import Dict, List
+
+from fixation_classifier import FixationClassifier
+
+
+CALIBRATION_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), "calibrations")
+CALIBRATION_VERSION = 1
+
+
+def calibration_path(participant: str, camera_setup: str, directory: str = CALIBRATION_DIRECTORY) -> str:
+    """One file per participant and camera setup, both reduced to characters that are safe in file names"""
+
+    safe = [re.sub(r"[^A-Za-z0-9_.-]", "-", part) for part in (participant, camera_setup)]
+    return os.path.join(directory, f"{safe[0]}__{safe[1]}.json")
+
+
+def save_calibration(
+    path: str,
+    participant: str,
+    camera_setup: str,
+    samples: Dict[str, List[List[float]]],
+    classifier: FixationClassifier,
+) -> None:
+    """Writes the raw calibration vectors and the fitted centroid of every target"""
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    centroids = dict(zip(classifier.names.tolist(), classifier.centroids.tolist()))
+    with open(f"{path}.tmp", "w") as calibration_file:
+        json.dump({
+            "version": CALIBRATION_VERSION,
+            "participant": participant,
+            "camera_setup": camera_setup,
+            "created": datetime.now().isoformat(),
+            "targets": {
+                name: {"centroid": centroids[name], "samples": [[float(value) for value in vector] for vector in vectors]}
+                for name, vectors in samples.items()
+            },
+        }, calibration_file)
+    # a crash while writing must not leave a truncated calibration behind
+    os.replace(f"{path}.tmp", path)
+
+
+class StoredCalibration:
+    def __init__(self, path: str):
+        with open(path) as calibration_file:
+            content = json.load(calibration_file)
+        if content.get("version") != CALIBRATION_VERSION:
+            raise ValueError(f"{path}: unsupported calibration version {content.get('version')}")
+
+        self.path = path
+        self.participant: str = content["participant"]
+        self.camera_setup: str = content["camera_setup"]
+        self.created = datetime.fromisoformat(content["created"])
+        self.samples: Dict[str, List[List[float]]] = {name: target["samples"] for name, target in content["targets"].items()}
+        self.centroids: Dict[str, List[float]] = {name: target["centroid"] for name, target in content["targets"].items()}
+
+    def classifier(self, **kwargs) -> FixationClassifier:
+        """The classifier of the fitted centroids, without fitting them again; `kwargs` go to the constructor"""
+
+        return FixationClassifier(list(self.centroids), list(self.centroids.values()), **kwargs)
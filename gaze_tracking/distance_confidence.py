@@ -12,8 +12,9 @@ def calculate_confidence(distances, lambda_scale=1.0):
         np.ndarray: Array of confidence scores for each fixation vector.
     """
     distances = np.array(distances)
-    # Compute the exponential weights
-    probabilities = np.exp(-lambda_scale * distances**2)
+    # Compute the exponential weights, relative to the closest fixation vector so they cannot all underflow
+    squared = distances**2
+    probabilities = np.exp(-lambda_scale * (squared - squared.min()))
     # Normalize to get confidence scores
     probabilities /= probabilities.sum()
     return probabilities
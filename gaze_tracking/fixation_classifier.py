@@ -0,0 +1,141 @@
+import json
+import os
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+from distance_confidence import calculate_confidence
+
+
+DEFAULT_TARGETS_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "targets.json")
+# below this many targets one vectorized distance over all centroids is faster than a tree lookup
+SPATIAL_INDEX_MIN_TARGETS = 64
+UNDEFINED = "undefined"
+# sensitivity of the confidence softmax over squared distances, measured in the squared distance of the
+# two closest targets so it does not depend on the calibration; at 2.0, a gaze vector between two targets
+# is confidently one of them up to 40% of the way to the other
+CONFIDENCE_SCALE = 2.0
+# confidence the nearest target needs to be reported instead of UNDEFINED
+MIN_CONFIDENCE = 0.6
+
+
+class GazeTargetConfig:
+    """Name and calibration prompt label of every gaze target, in calibration order"""
+
+    def __init__(self, names: List[str], labels: List[str]):
+        if len(set(names)) != len(names):
+            raise ValueError(f"duplicate gaze targets in {names}")
+        self.names = names
+        self.labels = labels
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_TARGETS_PATH) -> "GazeTargetConfig":
+        with open(path) as config_file:
+            targets = json.load(config_file)["targets"]
+        return cls(
+            [target["name"] for target in targets],
+            [target.get("label", target["name"]) for target in targets],
+        )
+
+
+def remove_outliers(vectors: np.ndarray, sd_threshold: float = 3) -> np.ndarray:
+    mean = np.mean(vectors, axis=0)
+    std_dev = np.std(vectors, axis=0)
+    distances = np.linalg.norm(vectors - mean, axis=1)
+    return vectors[distances < sd_threshold * np.linalg.norm(std_dev)]
+
+
+def closest_distance(centroids: np.ndarray) -> float:
+    """Smallest distance between two centroids, 0 for fewer than two"""
+
+    if len(centroids) < 2:
+        return 0.0
+    distances = np.linalg.norm(centroids[:, None] - centroids[None], axis=2)
+    return float(distances[np.triu_indices(len(centroids), 1)].min())
+
+
+class FixationClassifier:
+    """Nearest calibrated centroid classification of gaze vectors.
+
+    The centroids are rows of one contiguous (targets, 2) matrix, so a gaze vector is classified by a
+    single vectorized distance and argmin. From SPATIAL_INDEX_MIN_TARGETS targets on, a k-d tree is used
+    instead if scipy is installed.
+
+    classify_confident() additionally weighs the distances to all centroids into per-target confidences
+    and reports UNDEFINED if the nearest target has less than `min_confidence`.
+    """
+
+    def __init__(
+        self,
+        names: Sequence[str],
+        centroids: np.ndarray,
+        spatial_index_min_targets: int = SPATIAL_INDEX_MIN_TARGETS,
+        confidence_scale: float = CONFIDENCE_SCALE,
+        min_confidence: float = MIN_CONFIDENCE,
+    ):
+        if UNDEFINED in names:
+            raise ValueError(f"{UNDEFINED} is reserved for gaze that matches no target")
+        self.names = np.array(names)
+        self.min_confidence = min_confidence
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float64)
+        if self.centroids.shape != (len(self.names), 2):
+            raise ValueError(f"expected {len(self.names)} centroids of 2 dimensions, got shape {self.centroids.shape}")
+        self.confidence_scale = confidence_scale / (closest_distance(self.centroids) ** 2 or 1.0)
+        self.index = (
+            cKDTree(self.centroids)
+            if cKDTree is not None and len(self.names) >= spatial_index_min_targets
+            else None
+        )
+
+    @classmethod
+    def calibrate(cls, samples: Dict[str, List[Sequence[float]]], sd_threshold: float = 3, **kwargs) -> "FixationClassifier":
+        """Centroids are the mean of every target's calibration samples without outliers, `kwargs` go to the constructor"""
+
+        centroids = [
+            remove_outliers(np.asarray(vectors, dtype=np.float64)[:, :2], sd_threshold).mean(axis=0)
+            for vectors in samples.values()
+        ]
+        return cls(list(samples), np.stack(centroids), **kwargs)
+
+    def distances(self, gaze_vector: Sequence[float]) -> np.ndarray:
+        """Distance of a gaze vector to every centroid, in the order of `names`"""
+
+        return np.linalg.norm(self.centroids - np.asarray(gaze_vector[:2], dtype=np.float64), axis=1)
+
+    def nearest(self, gaze_vectors: np.ndarray) -> np.ndarray:
+        """Index of the nearest centroid of every row of a (n, 2+) array of gaze vectors"""
+
+        points = np.asarray(gaze_vectors, dtype=np.float64)[:, :2]
+        if self.index is not None:
+            return self.index.query(points)[1]
+        # |p - c|^2 = |p|^2 - 2 p.c + |c|^2, and |p|^2 does not change the argmin
+        scores = (self.centroids ** 2).sum(axis=1) - 2 * points @ self.centroids.T
+        return np.argmin(scores, axis=1)
+
+    def classify(self, gaze_vector: Sequence[float]) -> str:
+        if self.index is not None:
+            return str(self.names[self.index.query(np.asarray(gaze_vector[:2], dtype=np.float64))[1]])
+        return str(self.names[np.argmin(self.distances(gaze_vector))])
+
+    def confidences(self, gaze_vector: Sequence[float]) -> np.ndarray:
+        """Confidence of every target in the order of `names`, summing to 1"""
+
+        return calculate_confidence(self.distances(gaze_vector), self.confidence_scale)
+
+    def classify_confident(self, gaze_vector: Sequence[float]) -> Tuple[str, Dict[str, float]]:
+        """The nearest target, or UNDEFINED if it is not confident enough, and the confidence of every target"""
+
+        confidences = self.confidences(gaze_vector)
+        nearest = int(np.argmax(confidences))
+        fixation = str(self.names[nearest]) if confidences[nearest] >= self.min_confidence else UNDEFINED
+        return fixation, dict(zip(self.names.tolist(), confidences.tolist()))
+
+    def classify_batch(self, gaze_vectors: np.ndarray) -> np.ndarray:
+        """Gaze target name of every row of a (n, 2+) array of gaze vectors, e.g. a recorded session"""
+
+        return self.names[self.nearest(gaze_vectors)]
@@ -1,50 +1,125 @@
+import argparse
+import itertools
 import os
 import sys
 import time
-from typing import List
+import uuid
+from typing import Dict, List
 
 import requests
-import numpy as np
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 
 import cv2
 from pygaze import PyGaze, PyGazeRenderer
 
+from gaze_stream import GazeTargetStream
+from pipeline import GazePipeline, LatestSlot, Frame
+from inference_rate import AdaptiveInferenceRate, DEFAULT_CPU_PERCENT
+from fixation_classifier import FixationClassifier, GazeTargetConfig, DEFAULT_TARGETS_PATH, MIN_CONFIDENCE, UNDEFINED
+from calibration_store import StoredCalibration, calibration_path, save_calibration
+
 
 FIXATION_TIME_THRESHOLD = 0.15
+# a sent fixation held this long lets the inference rate drop
+STABLE_FIXATION_TIME = 0.5
+# a fixation is held until its confidence drops below this, even if another target is nearer by then;
+# entering a fixation needs the classifier's min confidence
+EXIT_CONFIDENCE = 0.4
 STATE_MACHINE_URL = "http://0.0.0.0:1111/gaze_target"
+STATE_MACHINE_STREAM_URL = "http://0.0.0.0:1111/gaze_stream"
 SHOW_IMAGE = False
+SUMMARY_INTERVAL = 10.0
+CAMERA_INDEX = 0
+CALIBRATION_FRAMES = 50
+VALIDATION_FRAMES = 10
+# share of a target's validation frames that must be classified as that target, otherwise it is recalibrated
+VALIDATION_MIN_ACCURACY = 0.8
+# new with every run, so the state machine does not take the restarted sequence numbers as stale
+SENDER_ID = f"gaze_tracking-{uuid.uuid4().hex[:8]}"
+RETRIES = 2
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--stream",
+    action="store_true",
+    help="send gaze targets over one long-lived stream instead of one POST per fixation",
+)
+parser.add_argument(
+    "--inference-budget",
+    type=float,
+    default=DEFAULT_CPU_PERCENT,
+    help="percent of time spent on gaze inference while a fixation is stable (default: %(default)s)",
+)
+parser.add_argument(
+    "--full-rate",
+    action="store_true",
+    help="run gaze inference on every frame, even while a fixation is stable",
+)
+parser.add_argument(
+    "--targets",
+    default=DEFAULT_TARGETS_PATH,
+    help="JSON file with the gaze targets to calibrate and classify (default: targets.json)",
+)
+parser.add_argument(
+    "--participant",
+    help="participant id, the calibration is saved for this participant and camera setup",
+)
+parser.add_argument(
+    "--camera-setup",
+    help="name of the camera setup the calibration belongs to (default: camera index and resolution)",
+)
+parser.add_argument(
+    "--reuse-calibration",
+    action="store_true",
+    help="load the saved calibration of the participant and camera setup instead of calibrating",
+)
+parser.add_argument(
+    "--validate",
+    action="store_true",
+    help=f"check the calibration with {VALIDATION_FRAMES} frames per target and recalibrate targets that fail",
+)
+parser.add_argument(
+    "--min-confidence",
+    type=float,
+    default=MIN_CONFIDENCE,
+    help="confidence a gaze target needs to be entered, below it the gaze is undefined (default: %(default)s)",
+)
+args = parser.parse_args()
 
 
 pg = PyGaze(model_path="models/eth-xgaze_resnet18.pth")
 pgren = PyGazeRenderer()
-v = cv2.VideoCapture(0)
-
+v = cv2.VideoCapture(CAMERA_INDEX)
+camera_setup = args.camera_setup or (
+    f"camera{CAMERA_INDEX}_{int(v.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(v.get(cv2.CAP_PROP_FRAME_HEIGHT))}"
+)
 
-gaze_calibration_vectors = {
-    "robot_face": [],
-    "packaging_area": [],
-    "left_handover_location": [],
-    "right_handover_location": [],
-}
 
-mean_fixation_vectors = {
-    "robot_face": None,
-    "packaging_area": None,
-    "left_handover_location": None,
-    "right_handover_location": None,
-}
+targets = GazeTargetConfig.load(args.targets)
+gaze_calibration_vectors: Dict[str, List[List[float]]] = {name: [] for name in targets.names}
 
 
 class GazeDetectionFilter:
+    """Sends a fixation once it has been held for FIXATION_TIME_THRESHOLD.
+
+    With the per-target confidences of a frame, the last sent fixation counts as the current one while
+    its confidence is at least EXIT_CONFIDENCE. Another target has to be entered with the classifier's
+    min confidence for FIXATION_TIME_THRESHOLD to be sent, so frames near a region boundary do not flip
+    the fixation back and forth. An UNDEFINED fixation is never sent.
+    """
+
     def __init__(self):
         self.current_fixation = None
         self.fixation_start_time = None
         self.last_triggered_fixation = None
 
-    def update_gaze(self, fixation: str):
-        now = time.time()
+    def update_gaze(self, fixation: str, now: float | None = None, confidences: Dict[str, float] | None = None):
+        now = now or time.time()
+
+        if confidences and confidences.get(self.last_triggered_fixation, 0.0) >= EXIT_CONFIDENCE:
+            fixation = self.last_triggered_fixation
 
         if fixation != self.current_fixation:
             self.current_fixation = fixation
@@ -52,141 +127,199 @@ class GazeDetectionFilter:
             return None
 
         duration = now - self.fixation_start_time
+        if fixation == UNDEFINED:
+            return None
         if duration >= FIXATION_TIME_THRESHOLD and fixation != self.last_triggered_fixation:
             self.last_triggered_fixation = fixation
             return fixation
 
         return None
 
+    def is_stable(self, now: float) -> bool:
+        """The current fixation has been sent and held for STABLE_FIXATION_TIME"""
 
-def calibration_loop(target: str, num_frames: int = 50):
-    counter = 0
-    while counter < num_frames+5:
+        return (
+            self.current_fixation not in (None, UNDEFINED)
+            and self.current_fixation == self.last_triggered_fixation
+            and now - self.fixation_start_time >= STABLE_FIXATION_TIME
+        )
+
+
+def capture_gaze_vectors(num_frames: int, skip: int = 5) -> List[List[float]]:
+    """Gaze vectors of `num_frames` frames with exactly one face, after skipping the first `skip`"""
+
+    vectors = []
+    while len(vectors) < num_frames + skip:
         ret, frame = v.read()
         if ret:
             gaze_result = pg.predict(frame)
             if len(gaze_result) == 1:
-                gaze_calibration_vectors[target].append(
-                    [gaze_result[0].gaze_vector[0], gaze_result[0].gaze_vector[1]]
-                )
+                vectors.append([float(gaze_result[0].gaze_vector[0]), float(gaze_result[0].gaze_vector[1])])
 
-                print("Recorded Gaze Vector:", gaze_result[0].gaze_vector[0], gaze_result[0].gaze_vector[1])
-                counter += 1
+                print("Recorded Gaze Vector:", vectors[-1][0], vectors[-1][1])
 
-    gaze_calibration_vectors[target] = gaze_calibration_vectors[target][5:]
+    return vectors[skip:]
 
 
-def find_closest_fixation(current_gaze_vector: np.ndarray) -> str:
-    reduced_vector = [current_gaze_vector[0], current_gaze_vector[1]]
-    distances = [
-        np.linalg.norm(reduced_vector - vec)
-        for vec in mean_fixation_vectors.values()
-    ]
-    
-    print({
-        "robot_face": distances[0],
-        "packaging_area": distances[1],
-        "left_handover_location": distances[2],
-        "right_handover_location": distances[3],
-    })
+def calibration_loop(target: str, num_frames: int = CALIBRATION_FRAMES):
+    gaze_calibration_vectors[target] = capture_gaze_vectors(num_frames)
 
-    most_similar_index = np.argmin(distances)
-    return list(mean_fixation_vectors.keys())[most_similar_index]
 
+def validate(classifier: FixationClassifier) -> List[str]:
+    """Returns the targets whose validation frames are not classified as that target often enough"""
 
-def remove_outliers(vector_list: List[np.ndarray], sd_threshold=3) -> List[np.ndarray]:
-    vector_list_array = np.stack(vector_list)  # Shape: (n_samples, n_features)
-    mean = np.mean(vector_list_array, axis=0)
-    std_dev = np.std(vector_list_array, axis=0)
-    distances = np.linalg.norm(vector_list_array - mean, axis=1)
-    mask = distances < sd_threshold * np.linalg.norm(std_dev)
-    filtered_vectors = vector_list_array[mask]
-    return [np.array(vec) for vec in filtered_vectors]
+    failed = []
+    for name, label in zip(targets.names, targets.labels):
+        input(f"Press ENTER to validate {label} ...")
+        vectors = capture_gaze_vectors(VALIDATION_FRAMES, skip=2)
+        accuracy = float((classifier.classify_batch(vectors) == name).mean())
+        print(f"[{label}] Validation accuracy: {accuracy:.0%}")
+        if accuracy < VALIDATION_MIN_ACCURACY:
+            failed.append(name)
+    return failed
 
 
-def calculate_mean_fixation_vectors() -> None:
-    for target in mean_fixation_vectors.keys():
-        print("Before", len(gaze_calibration_vectors[target]))
-        gaze_calibration_vectors[target] = remove_outliers(gaze_calibration_vectors[target])
-        print("After", len(gaze_calibration_vectors[target]))
-        mean_fixation_vectors[target] = np.mean(gaze_calibration_vectors[target], axis=0)
+sequence = itertools.count(1)
 
 
 def send_gaze_target(fixation: str):
-    payload = {"target": fixation}
+    payload = {"target": fixation, "sender": SENDER_ID, "seq": next(sequence)}
     headers = {
     'Content-Type': 'application/json'
     }
 
-    try:
-        resp = requests.request("POST", STATE_MACHINE_URL, headers=headers, json=payload, timeout=0.2)
-        resp.raise_for_status()
-    except Exception as e:
-        print("ERROR while sending data to state_machine: ", str(e))
-        pass
-
-
-input("Press ENTER to capture Robot Face ...")
-calibration_loop("robot_face")
-
-input("Press ENTER to capture Packaging Area ...")
-calibration_loop("packaging_area")
-
-input("Press ENTER to capture Left Handover Location ...")
-calibration_loop("left_handover_location")
-
-input("Press ENTER to capture Right Handover Location ...")
-calibration_loop( "right_handover_location")
-
-print("DONE ...")
-
-
-calculate_mean_fixation_vectors()
-
-
-print("[Robot Face] Mean Fixation Vector:", str(mean_fixation_vectors["robot_face"]))
-print("[Packaging Area] Mean Fixation Vector:", str(mean_fixation_vectors["packaging_area"]))
-print("[Left Handover Location] Mean Fixation Vector:", str(mean_fixation_vectors["left_handover_location"]))
-print("[Right Handover Location] Mean Fixation Vector:", str(mean_fixation_vectors["right_handover_location"]))
+    for attempt in range(RETRIES):
+        try:
+            resp = requests.request("POST", STATE_MACHINE_URL, headers=headers, json=payload, timeout=0.1)
+            resp.raise_for_status()
+            return
+        except Exception as e:
+            if attempt == RETRIES - 1:
+                print("ERROR while sending data to state_machine: ", str(e))
+
+
+stored_path = calibration_path(args.participant, camera_setup) if args.participant else None
+classifier = None
+if args.reuse_calibration:
+    if stored_path and os.path.exists(stored_path):
+        stored = StoredCalibration(stored_path)
+        if set(stored.centroids) == set(targets.names):
+            gaze_calibration_vectors.update(stored.samples)
+            classifier = stored.classifier(min_confidence=args.min_confidence)
+            print(f"Loaded the calibration of {stored.created:%Y-%m-%d %H:%M} from {stored_path}")
+        else:
+            print(f"{stored_path} was calibrated for {list(stored.centroids)}, not {targets.names}, calibrating again")
+    elif stored_path:
+        print(f"No calibration saved for participant {args.participant} and {camera_setup}, calibrating")
+    else:
+        print("--reuse-calibration needs --participant, calibrating")
+
+calibrated = classifier is None
+if calibrated:
+    for name, label in zip(targets.names, targets.labels):
+        input(f"Press ENTER to capture {label} ...")
+        calibration_loop(name)
+
+    print("DONE ...")
+    classifier = FixationClassifier.calibrate(gaze_calibration_vectors, min_confidence=args.min_confidence)
+
+if args.validate:
+    failed = validate(classifier)
+    labels = dict(zip(targets.names, targets.labels))
+    for name in failed:
+        input(f"Press ENTER to capture {labels[name]} again ...")
+        calibration_loop(name)
+    if failed:
+        classifier = FixationClassifier.calibrate(gaze_calibration_vectors, min_confidence=args.min_confidence)
+        calibrated = True
+
+if calibrated and stored_path:
+    save_calibration(stored_path, args.participant, camera_setup, gaze_calibration_vectors, classifier)
+    print("Saved the calibration to", stored_path)
+
+labels = dict(zip(targets.names, targets.labels))
+for name, centroid in zip(classifier.names.tolist(), classifier.centroids):
+    print(f"[{labels[name]}] Mean Fixation Vector:", str(centroid))
 
 print("\n\n")
 input("Press ENTER to start recording ...")
 
 filter = GazeDetectionFilter()
-while v.isOpened():
-    ret, frame = v.read()
-    if ret:
-        gaze_result = pg.predict(frame)
-        if gaze_result:
-            face = gaze_result[0]
-            color = (0, 255, 0)
-            if pg.look_at_camera(face):
-                color = (255, 0, 0)
-            pgren.render(
-                frame,
-                face,
-                draw_face_bbox=True,
-                draw_face_landmarks=False,
-                draw_3dface_model=False,
-                draw_head_pose=False,
-                draw_gaze_vector=True,
-                color=color,
-            )
-
-            fixation = find_closest_fixation(face.gaze_vector)
-
-            cv2.putText(
-                frame, fixation, (90, 60), cv2.FONT_HERSHEY_DUPLEX, 1.6, (147, 58, 31), 2
-            )
-
-            stable_fixation = filter.update_gaze(fixation)
-            if stable_fixation:
-                send_gaze_target(fixation)
+gaze_stream = GazeTargetStream(STATE_MACHINE_STREAM_URL) if args.stream else None
+display = LatestSlot()
+rate = None if args.full_rate else AdaptiveInferenceRate(cpu_percent=args.inference_budget)
 
-        if SHOW_IMAGE:
-            cv2.imshow("frame", frame)
-        if cv2.waitKey(1) & 0xFF == ord("q"):
-            break
 
+def classify(frame: Frame) -> str | None:
+    if not frame.gaze_result:
+        if rate:
+            rate.set_stable(False)
+        return None
+    face = frame.gaze_result[0]
+    fixation, confidences = classifier.classify_confident(face.gaze_vector)
+
+    if SHOW_IMAGE:
+        color = (0, 255, 0)
+        if pg.look_at_camera(face):
+            color = (255, 0, 0)
+        pgren.render(
+            frame.image,
+            face,
+            draw_face_bbox=True,
+            draw_face_landmarks=False,
+            draw_3dface_model=False,
+            draw_head_pose=False,
+            draw_gaze_vector=True,
+            color=color,
+        )
+        cv2.putText(
+            frame.image, fixation, (90, 60), cv2.FONT_HERSHEY_DUPLEX, 1.6, (147, 58, 31), 2
+        )
+
+    # the fixation duration is measured between capture times, not between the moments of classification
+    target = filter.update_gaze(fixation, frame.captured_at, confidences)
+    if rate:
+        rate.set_stable(filter.is_stable(frame.captured_at))
+    return target
+
+
+def dispatch(fixation: str, captured_at: float):
+    if gaze_stream:
+        gaze_stream.send(fixation, captured_at)
+    else:
+        send_gaze_target(fixation)
+
+
+pipeline = GazePipeline(
+    read=v.read,
+    predict=pg.predict,
+    classify=classify,
+    dispatch=dispatch,
+    on_frame=display.put if SHOW_IMAGE else None,
+    rate=rate,
+)
+pipeline.start()
+last_summary = time.time()
+try:
+    while pipeline.is_running() and v.isOpened():
+        if SHOW_IMAGE:
+            frame = display.get(timeout=0.05)
+            if frame is not None:
+                cv2.imshow("frame", frame.image)
+            if cv2.waitKey(1) & 0xFF == ord("q"):
+                break
+        else:
+            time.sleep(0.05)
+
+        if time.time() - last_summary >= SUMMARY_INTERVAL:
+            print("Pipeline:", pipeline.summary())
+            last_summary = time.time()
+except KeyboardInterrupt:
+    pass
+
+pipeline.stop()
+print("Pipeline:", pipeline.summary())
+if gaze_stream:
+    gaze_stream.close()
 v.release()
 cv2.destroyAllWindows()
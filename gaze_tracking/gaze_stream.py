@@ -0,0 +1,63 @@
+import json
+import queue
+import threading
+import time
+
+import requests
+
+
+CONNECT_TIMEOUT = 0.5
+RECONNECT_DELAY = 1.0
+# a stream request is ended after this long and a new one started, below the state machine's own limit
+STREAM_SECONDS = 5
+
+
+class GazeTargetStream:
+    """Streams gaze targets to the state machine over long-lived chunked POSTs.
+
+    Every target is sent as a newline-delimited JSON line with a sequence number and its capture timestamp,
+    so the connection and request overhead is paid once per STREAM_SECONDS instead of per fixation. The
+    request is ended between two targets and a new one started, so no target is lost on the way; the state
+    machine cannot shut down while a request is open.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.seq = 0
+        self.queue: queue.Queue = queue.Queue()
+        self.closing = threading.Event()
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def send(self, fixation: str, captured_at: float | None = None) -> None:
+        self.seq += 1
+        self.queue.put({"seq": self.seq, "target": fixation, "captured_at": captured_at or time.time()})
+
+    def close(self) -> None:
+        self.closing.set()
+        self.queue.put(None)
+        self.thread.join(timeout=CONNECT_TIMEOUT)
+
+    def __lines(self):
+        deadline = time.time() + STREAM_SECONDS
+        while (remaining := deadline - time.time()) > 0:
+            try:
+                message = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                return
+            if message is None:
+                self.queue.put(None)
+                return
+            yield (json.dumps(message) + "\n").encode()
+
+    def __run(self) -> None:
+        while True:
+            try:
+                resp = requests.post(self.url, data=self.__lines(), timeout=(CONNECT_TIMEOUT, None))
+                resp.raise_for_status()
+                if self.closing.is_set():
+                    print("Gaze stream closed:", resp.json())
+                    return
+            except Exception as e:
+                print("ERROR while streaming data to state_machine: ", str(e))
+                time.sleep(RECONNECT_DELAY)
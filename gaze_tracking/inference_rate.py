@@ -0,0 +1,93 @@
+import threading
+
+import numpy as np
+
+
+# share of the inference thread's time that may be spent on gaze inference while a fixation is stable;
+# an eyes-only look away is noticed after at most one interval of inference_duration * 100 / cpu_percent
+DEFAULT_CPU_PERCENT = 25.0
+# mean absolute difference of the downsampled grey image that counts as head motion
+MOTION_THRESHOLD = 6.0
+MOTION_STRIDE = 16
+DURATION_SMOOTHING = 0.2
+
+
+def thumbnail(image) -> np.ndarray | None:
+    if not isinstance(image, np.ndarray):
+        return None
+    pixels = image[::MOTION_STRIDE, ::MOTION_STRIDE]
+    return pixels.mean(axis=2, dtype=np.float32) if pixels.ndim == 3 else pixels.astype(np.float32)
+
+
+class AdaptiveInferenceRate:
+    """Decides for every captured frame whether gaze inference runs on it.
+
+    Inference runs on every frame until the classification reports a stable fixation. While stable,
+    frames are skipped so that inference takes at most `cpu_percent` of the inference thread's time.
+    Head motion, detected as a change of a downsampled frame against the last inferred one, or a
+    changed classification return to full rate.
+    """
+
+    def __init__(
+        self,
+        cpu_percent: float = DEFAULT_CPU_PERCENT,
+        motion_threshold: float = MOTION_THRESHOLD,
+    ):
+        if not 0 < cpu_percent <= 100:
+            raise ValueError(f"cpu_percent must be in (0, 100], got {cpu_percent}")
+        self.cpu_percent = cpu_percent
+        self.motion_threshold = motion_threshold
+
+        self.lock = threading.Lock()
+        self.stable = False
+        self.inference_duration = 0.0
+        self.last_inference_at = None
+        self.reference = None
+        self.inferred = 0
+        self.skipped = 0
+        self.motion_wakeups = 0
+
+    def interval(self) -> float:
+        """Seconds between inferences while the fixation is stable"""
+
+        return self.inference_duration * 100 / self.cpu_percent
+
+    def should_infer(self, image, captured_at: float) -> bool:
+        with self.lock:
+            if not self.stable or self.last_inference_at is None:
+                return True
+            if captured_at - self.last_inference_at >= self.interval():
+                return True
+            current = thumbnail(image)
+            if current is not None and self.reference is not None and current.shape == self.reference.shape:
+                if float(np.mean(np.abs(current - self.reference))) >= self.motion_threshold:
+                    self.stable = False
+                    self.motion_wakeups += 1
+                    return True
+            self.skipped += 1
+            return False
+
+    def record_inference(self, image, captured_at: float, duration: float) -> None:
+        with self.lock:
+            self.inferred += 1
+            self.last_inference_at = captured_at
+            self.reference = thumbnail(image)
+            if self.inference_duration:
+                self.inference_duration += DURATION_SMOOTHING * (duration - self.inference_duration)
+            else:
+                self.inference_duration = duration
+
+    def set_stable(self, stable: bool) -> None:
+        with self.lock:
+            self.stable = stable
+
+    def summary(self) -> dict:
+        with self.lock:
+            frames = self.inferred + self.skipped
+            return {
+                "inferred": self.inferred,
+                "skipped": self.skipped,
+                "skipped_share": self.skipped / frames if frames else None,
+                "motion_wakeups": self.motion_wakeups,
+                "stable_interval_ms": self.interval() * 1000,
+            }
@@ -0,0 +1,203 @@
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Tuple
+
+from inference_rate import AdaptiveInferenceRate
+
+
+TIMING_WINDOW = 500
+DISPATCH_QUEUE_SIZE = 64
+
+
+class Frame:
+    def __init__(self, seq: int, image, captured_at: float):
+        self.seq = seq
+        self.image = image
+        self.captured_at = captured_at
+        self.gaze_result = None
+
+
+class LatestSlot:
+    """Hands the most recent item from one thread to another; an item not taken before the next one is put is dropped"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.item = None
+        self.closed = False
+        self.dropped = 0
+
+    def put(self, item) -> None:
+        with self.condition:
+            if self.item is not None:
+                self.dropped += 1
+            self.item = item
+            self.condition.notify()
+
+    def get(self, timeout: float | None = None):
+        """Blocks until an item is available, returns None once the slot is closed or after `timeout` seconds"""
+
+        with self.condition:
+            self.condition.wait_for(lambda: self.item is not None or self.closed, timeout)
+            item, self.item = self.item, None
+            return item
+
+    def close(self) -> None:
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class StageTimer:
+    """Processing time of one stage and the latency from capture to the end of the stage, in ms"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples: Deque[Tuple[float, float]] = deque(maxlen=TIMING_WINDOW)
+
+    def record(self, started_at: float, captured_at: float) -> None:
+        now = time.time()
+        with self.lock:
+            self.samples.append(((now - started_at) * 1000, (now - captured_at) * 1000))
+
+    def summary(self) -> Dict[str, float | None]:
+        with self.lock:
+            durations = sorted(duration for duration, _ in self.samples)
+            latencies = sorted(latency for _, latency in self.samples)
+        if not durations:
+            return {"count": 0, "stage_p50_ms": None, "stage_max_ms": None, "since_capture_p50_ms": None}
+        return {
+            "count": len(durations),
+            "stage_p50_ms": durations[len(durations) // 2],
+            "stage_max_ms": durations[-1],
+            "since_capture_p50_ms": latencies[len(latencies) // 2],
+        }
+
+
+class GazePipeline:
+    """Runs capture, inference, classification and dispatch of gaze targets in their own threads.
+
+    Capture and inference hand over through latest-frame-wins slots, so a slow stage skips stale frames
+    instead of building a backlog, and a frame's latency from capture to delivery is bounded by the
+    slowest stage rather than the sum of all stages. Classified gaze targets are dispatched in order
+    from a bounded queue, so a slow request to the state machine never stalls the camera.
+
+    `read` returns (ok, image), `predict` the gaze result of an image, `classify` the gaze target to send
+    for a Frame (or None) and `dispatch` delivers a gaze target with its capture time. `on_frame` gets
+    every classified Frame, e.g. to display it, and is called from the classification thread. With a
+    `rate`, inference skips the frames it rejects.
+    """
+
+    def __init__(
+        self,
+        read: Callable[[], Tuple[bool, Any]],
+        predict: Callable[[Any], Any],
+        classify: Callable[[Frame], str | None],
+        dispatch: Callable[[str, float], None],
+        on_frame: Callable[[Frame], None] | None = None,
+        rate: AdaptiveInferenceRate | None = None,
+    ):
+        self.read = read
+        self.predict = predict
+        self.classify = classify
+        self.dispatch = dispatch
+        self.on_frame = on_frame
+        self.rate = rate
+
+        self.frames = LatestSlot()
+        self.predictions = LatestSlot()
+        self.targets: queue.Queue = queue.Queue(maxsize=DISPATCH_QUEUE_SIZE)
+        self.running = threading.Event()
+        self.timers = {stage: StageTimer() for stage in ("capture", "inference", "classification", "dispatch")}
+        self.dispatch_dropped = 0
+        self.threads = [
+            threading.Thread(target=self.__capture, name="capture", daemon=True),
+            threading.Thread(target=self.__infer, name="inference", daemon=True),
+            threading.Thread(target=self.__classify, name="classification", daemon=True),
+            threading.Thread(target=self.__dispatch, name="dispatch", daemon=True),
+        ]
+
+    def start(self) -> None:
+        self.running.set()
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self) -> None:
+        self.running.clear()
+        self.frames.close()
+        self.predictions.close()
+        *producers, dispatcher = self.threads
+        for thread in producers:
+            thread.join(timeout=1.0)
+
+        # undelivered gaze targets are stale by now; the dispatch thread may take the last ones meanwhile
+        while True:
+            try:
+                self.targets.get_nowait()
+            except queue.Empty:
+                break
+        try:
+            self.targets.put_nowait(None)
+        except queue.Full:
+            # only if classification is still stuck after the join, the daemon thread ends with the process
+            pass
+        dispatcher.join(timeout=1.0)
+
+    def is_running(self) -> bool:
+        return self.running.is_set()
+
+    def summary(self) -> dict:
+        return {
+            **{stage: timer.summary() for stage, timer in self.timers.items()},
+            "frames_skipped": self.frames.dropped + self.predictions.dropped,
+            "targets_dropped": self.dispatch_dropped,
+            **({"inference_rate": self.rate.summary()} if self.rate else {}),
+        }
+
+    def __capture(self) -> None:
+        seq = 0
+        while self.running.is_set():
+            started_at = time.time()
+            ok, image = self.read()
+            if not ok:
+                # the camera is gone
+                self.running.clear()
+                break
+            seq += 1
+            frame = Frame(seq, image, time.time())
+            self.timers["capture"].record(started_at, frame.captured_at)
+            self.frames.put(frame)
+        self.frames.close()
+
+    def __infer(self) -> None:
+        while (frame := self.frames.get()) is not None:
+            if self.rate and not self.rate.should_infer(frame.image, frame.captured_at):
+                continue
+            started_at = time.time()
+            frame.gaze_result = self.predict(frame.image)
+            self.timers["inference"].record(started_at, frame.captured_at)
+            if self.rate:
+                self.rate.record_inference(frame.image, frame.captured_at, time.time() - started_at)
+            self.predictions.put(frame)
+        self.predictions.close()
+
+    def __classify(self) -> None:
+        while (frame := self.predictions.get()) is not None:
+            started_at = time.time()
+            target = self.classify(frame)
+            self.timers["classification"].record(started_at, frame.captured_at)
+            if target:
+                try:
+                    self.targets.put_nowait((target, frame.captured_at))
+                except queue.Full:
+                    self.dispatch_dropped += 1
+            if self.on_frame:
+                self.on_frame(frame)
+
+    def __dispatch(self) -> None:
+        while (item := self.targets.get()) is not None:
+            target, captured_at = item
+            started_at = time.time()
+            self.dispatch(target, captured_at)
+            self.timers["dispatch"].record(started_at, captured_at)
@@ -1,10 +1,32 @@
+import itertools
+import uuid
+
 import requests
 
 STATE_MACHINE_URL   = "http://0.0.0.0:1111"
 
+SENDER_ID = f"robot_controller-{uuid.uuid4().hex[:8]}"
+REQUEST_TIMEOUT = 0.2
+RETRIES = 3
+
+sequence = itertools.count(1)
+
+
+def post(path: str, payload: dict):
+    payload = {**payload, "sender": SENDER_ID, "seq": next(sequence)}
+    for attempt in range(RETRIES):
+        try:
+            resp = requests.post(f"{STATE_MACHINE_URL}{path}", json=payload, timeout=REQUEST_TIMEOUT)
+            resp.raise_for_status()
+            return
+        except Exception:
+            if attempt == RETRIES - 1:
+                raise
+
+
 def notify_arm_location(arm_location: str):
     try:
-        requests.post(f"{STATE_MACHINE_URL}/arm_location", json={"location": arm_location}, timeout=0.5)
+        post("/arm_location", {"location": arm_location})
         print("Sending to state machine:", arm_location)
     except Exception as e:
         print("ERROR while sending data to state machine: ", str(e))
@@ -13,7 +35,7 @@ def notify_arm_location(arm_location: str):
 
 def notify_handover_finished():
     try:
-        requests.post(f"{STATE_MACHINE_URL}/event", json={"name": "handover_finished"}, timeout=0.5)
+        post("/event", {"name": "handover_finished"})
         print("Sending event to state machine: handover_finished")
     except Exception as e:
         print("ERROR while sending data to state machine: ", str(e))
@@ -22,7 +44,7 @@ def notify_handover_finished():
 
 def notify_task_completed():
     try:
-        requests.post(f"{STATE_MACHINE_URL}/event", json={"name": "task_completed"}, timeout=0.5)
+        post("/event", {"name": "task_completed"})
         print("Sending event to state machine: task_completed")
     except Exception as e:
         print("ERROR while sending data to state machine: ", str(e))
@@ -0,0 +1,223 @@
+import asyncio
+import time
+from collections import deque
+from enum import IntEnum
+from typing import Callable, Deque, Dict, List, Tuple
+
+from fsm import StateMachine, StateUpdate, UpdatedState, HandoverState, GazeProgram
+from metrics import EVENT_TO_TRANSITION, QUEUE_WAIT, GUARD_EVALUATIONS
+
+
+LATENCY_WINDOW = 1000
+
+
+class Lane(IntEnum):
+    """Priority classes of updates, lower values are processed first.
+
+    Everything that drives or depends on a handover transition shares the HANDOVER lane, so it keeps its
+    arrival order: an arm location has to be applied before the object_in_bowl that follows it, and a
+    gaze_program_finished must not be applied to a program set by a handover event queued after it.
+    Only gaze targets and deadline ticks, whose effect depends on the state at the time they are applied
+    rather than on the updates around them, may be overtaken.
+    """
+
+    HANDOVER = 0
+    GAZE = 1
+
+    @property
+    def label(self) -> str:
+        return self.name.lower()
+
+
+def lane_of(update: StateUpdate) -> Lane:
+    if update.new_gaze_target or update.state_loop_update:
+        return Lane.GAZE
+    return Lane.HANDOVER
+
+
+class UpdateResult:
+    """Changes of one update and the state right after it"""
+
+    def __init__(self, changes: UpdatedState, handover_state: HandoverState, gaze_program: GazeProgram):
+        self.changes = changes
+        self.handover_state = handover_state
+        self.gaze_program = gaze_program
+
+    def to_dict(self) -> dict:
+        return {
+            "handover_state": self.handover_state.value,
+            "gaze_program": self.gaze_program.value,
+            "arm_program": self.changes.arm_program.value if self.changes.arm_program else None,
+            "changes": self.changes.to_dict(),
+        }
+
+
+class QueuedUpdate:
+    def __init__(self, update: StateUpdate, received_at: float | None = None):
+        self.update = update
+        self.lane = lane_of(update)
+        self.enqueued_at = time.perf_counter()
+        # a gaze target is received before the gaze filter hands it on, other updates are enqueued on receipt
+        self.received_at = received_at or self.enqueued_at
+        self.dequeued_at: float | None = None
+        self.processed_at: float | None = None
+        # set for callers awaiting the result of their update
+        self.result: asyncio.Future | None = None
+
+
+class LaneQueue:
+    """One FIFO per lane for a single consumer; get() takes the oldest update of the highest priority lane"""
+
+    def __init__(self):
+        self.lanes: List[Deque[QueuedUpdate]] = [deque() for _ in Lane]
+        self.not_empty = asyncio.Event()
+
+    def put_nowait(self, item: QueuedUpdate) -> None:
+        self.lanes[item.lane].append(item)
+        self.not_empty.set()
+
+    def get_nowait(self) -> QueuedUpdate:
+        for lane in self.lanes:
+            if lane:
+                return lane.popleft()
+        raise asyncio.QueueEmpty
+
+    async def get(self) -> QueuedUpdate:
+        while self.empty():
+            self.not_empty.clear()
+            await self.not_empty.wait()
+        return self.get_nowait()
+
+    def empty(self) -> bool:
+        return not any(self.lanes)
+
+    def qsize(self) -> int:
+        return sum(len(lane) for lane in self.lanes)
+
+    def depths(self) -> Dict[Lane, int]:
+        return {lane: len(self.lanes[lane]) for lane in Lane}
+
+    def blocks(self, lane: Lane) -> bool:
+        """Whether an update in `lane` would have to wait behind a queued one"""
+
+        return any(self.lanes[index] for index in range(lane + 1))
+
+
+def percentile(values: list, q: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class StateMachineActor:
+    """Single writer of a StateMachine.
+
+    All updates go through one queue and are applied one at a time by a single task on the event loop,
+    so `sm.state` is never mutated concurrently. The queue has a lane per priority class: handover events,
+    arm locations and finished gaze programs are processed in arrival order before gaze targets and
+    deadline ticks, so a burst of gaze targets never delays a handover event. Within a lane updates keep
+    their arrival order.
+    """
+
+    def __init__(self, sm: StateMachine, on_changes: Callable[[StateUpdate, UpdatedState], None], session_id: str = "default"):
+        self.sm = sm
+        self.session_id = session_id
+        self.on_changes = on_changes
+        self.queue: LaneQueue | None = None
+        self.worker: asyncio.Task | None = None
+        # (lane, queue wait, event to transition) in ms of the most recent updates
+        self.latencies: Deque[Tuple[Lane, float, float]] = deque(maxlen=LATENCY_WINDOW)
+
+    def start(self) -> None:
+        self.queue = LaneQueue()
+        self.worker = asyncio.get_running_loop().create_task(self.__run())
+
+    async def stop(self) -> None:
+        """Applies the pending handover lane updates and discards the pending gaze targets and deadline ticks"""
+
+        if self.worker:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+        while self.queue and not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item.lane == Lane.HANDOVER:
+                item.dequeued_at = time.perf_counter()
+                self.__process(item)
+            elif item.result:
+                item.result.cancel()
+
+    def submit(self, update: StateUpdate, received_at: float | None = None) -> QueuedUpdate:
+        """Must be called on the event loop, `received_at` is the time.perf_counter() the update arrived at"""
+
+        item = QueuedUpdate(update, received_at)
+        self.queue.put_nowait(item)
+        return item
+
+    async def apply(self, update: StateUpdate) -> UpdateResult:
+        """Applies `update` and returns its result, must be called on the event loop.
+
+        With no update of the same or a higher priority pending the update is processed inline, without
+        a hop through the queue; otherwise it is queued behind the pending ones of its lane.
+        """
+        item = QueuedUpdate(update)
+        item.result = asyncio.get_running_loop().create_future()
+        if not self.queue.blocks(item.lane):
+            item.dequeued_at = item.enqueued_at
+            self.__process(item)
+        else:
+            self.queue.put_nowait(item)
+        return await item.result
+
+    def latency_summary(self) -> dict:
+        waits = [wait for _, wait, _ in self.latencies]
+        totals = [total for _, _, total in self.latencies]
+        return {
+            "processed": len(self.latencies),
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "wait_p50_ms": percentile(waits, 0.5),
+            "wait_p99_ms": percentile(waits, 0.99),
+            "transition_p50_ms": percentile(totals, 0.5),
+            "transition_p99_ms": percentile(totals, 0.99),
+            "lanes": {lane.label: self.__lane_summary(lane) for lane in Lane},
+        }
+
+    def __lane_summary(self, lane: Lane) -> dict:
+        waits = [wait for update_lane, wait, _ in self.latencies if update_lane == lane]
+        return {
+            "processed": len(waits),
+            "wait_p50_ms": percentile(waits, 0.5),
+            "wait_p99_ms": percentile(waits, 0.99),
+        }
+
+    async def __run(self) -> None:
+        while True:
+            item = await self.queue.get()
+            item.dequeued_at = time.perf_counter()
+            self.__process(item)
+            # lets requests that arrived meanwhile enqueue, so a handover event overtakes the rest of a gaze burst
+            await asyncio.sleep(0)
+
+    def __process(self, item: QueuedUpdate) -> None:
+        try:
+            changes = self.sm.update_state(item.update)
+            if item.result and not item.result.done():
+                state = self.sm.state
+                item.result.set_result(UpdateResult(changes, state.current_handover_state, state.current_gaze_program))
+            self.on_changes(item.update, changes)
+        except Exception as e:
+            print("ERROR while processing state update: ", str(e))
+            if item.result and not item.result.done():
+                item.result.set_exception(e)
+        item.processed_at = time.perf_counter()
+        self.latencies.append((
+            item.lane,
+            (item.dequeued_at - item.enqueued_at) * 1000,
+            (item.processed_at - item.received_at) * 1000,
+        ))
+        QUEUE_WAIT.observe(item.dequeued_at - item.enqueued_at, self.session_id, item.lane.label)
+        EVENT_TO_TRANSITION.observe(item.processed_at - item.received_at, self.session_id, item.lane.label)
+        GUARD_EVALUATIONS.observe(self.sm.guard_evaluations, self.session_id)
@@ -0,0 +1,306 @@
+"""Aggregates the handover and gaze data of all sessions in the output directory.
+
+Every session directory of the session store (`<identifier>_<dynamic|static>[_demo]`) is summarized on its
+own in a process pool, as are the `_handover.csv` and `_gaze.csv` files of sessions that only exist as CSV.
+The summaries are cached by modification time, so a re-run after adding a participant only reads the new
+sessions. The summaries are then combined per participant and per condition:
+
+    python analytics.py
+    python analytics.py --include-demo --output-directory ./output
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from data_logger import OUTPUT_DIRECTORY
+from session_store import SessionData, META_FILE, is_session
+
+
+SESSION_NAME = r"(?P<participant>.+)_(?P<condition>dynamic|static)(?P<demo>_demo)?"
+SESSION_DIRECTORY = re.compile(f"^{SESSION_NAME}$")
+SESSION_FILE = re.compile(f"^{SESSION_NAME}_(?P<kind>handover|gaze)\\.csv$")
+CACHE_FILE = "analytics_cache.json"
+# bumped whenever the summary format changes, older caches are discarded
+CACHE_VERSION = 2
+PARTICIPANTS_FILE = "analysis_participants.csv"
+CONDITIONS_FILE = "analysis_conditions.csv"
+
+
+def read_columns(path: str) -> Dict[str, np.ndarray]:
+    with open(path, newline="") as csv_file:
+        reader = csv.reader(csv_file)
+        header = next(reader, None)
+        rows = list(reader)
+    if not header:
+        return {}
+    table = np.array(rows, dtype=str).reshape(len(rows), len(header))
+    return {name: table[:, index] for index, name in enumerate(header)}
+
+
+def numeric(column: np.ndarray) -> np.ndarray:
+    """Parses a column of numbers, empty cells (None when the file was written) become NaN"""
+
+    return np.where(column == "", "nan", column).astype(float)
+
+
+def finite(values: np.ndarray) -> List[float]:
+    return values[np.isfinite(values)].tolist()
+
+
+def summarize_handovers(errors: np.ndarray, init_to_bowl: np.ndarray, bowl_to_bowl: np.ndarray) -> dict:
+    return {
+        "handovers": len(errors),
+        "errors": int(np.count_nonzero(errors)),
+        "init_to_bowl": finite(init_to_bowl),
+        "bowl_to_bowl": finite(bowl_to_bowl),
+    }
+
+
+def summarize_gaze(targets: List[str], codes: np.ndarray, durations: np.ndarray) -> dict:
+    # the last target of a session has no duration
+    dwell = np.bincount(codes, weights=np.nan_to_num(durations), minlength=len(targets))
+    fixations = np.bincount(codes, minlength=len(targets))
+    return {
+        "dwell": dict(zip(targets, dwell.tolist())),
+        "fixations": dict(zip(targets, fixations.tolist())),
+    }
+
+
+def summarize_session(directory: str) -> dict:
+    session = SessionData(directory)
+    init_to_bowl, bowl_to_bowl, _ = session.handover_durations()
+    return {
+        "handover": summarize_handovers(session.handover_error, init_to_bowl, bowl_to_bowl),
+        "gaze": summarize_gaze(session.gaze_targets, session.gaze_target, session.gaze_durations()),
+    }
+
+
+def summarize_csv(path: str) -> dict:
+    kind = SESSION_FILE.match(os.path.basename(path))["kind"]
+    columns = read_columns(path)
+    if not columns:
+        return {}
+    if kind == "handover":
+        return {"handover": summarize_handovers(
+            columns["error"] == "True",
+            numeric(columns["init_to_bowl_duration"]),
+            numeric(columns["bowl_to_bowl_duration"]),
+        )}
+    targets, codes = np.unique(columns["target"], return_inverse=True)
+    return {"gaze": summarize_gaze(targets.tolist(), codes, numeric(columns["duration"]))}
+
+
+def summarize(path: str) -> dict:
+    """Summaries of a session directory or CSV file by kind (handover, gaze)"""
+
+    return summarize_session(path) if os.path.isdir(path) else summarize_csv(path)
+
+
+class SummaryCache:
+    """Summaries keyed by session directory or file name, valid as long as modification time and size are unchanged"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, dict] = {}
+        try:
+            with open(path) as cache_file:
+                content = json.load(cache_file)
+            if content.get("version") == CACHE_VERSION:
+                self.entries = content["files"]
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def signature(path: str) -> Tuple[int, int]:
+        # the meta file of a session directory is written last
+        stat = os.stat(os.path.join(path, META_FILE) if os.path.isdir(path) else path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self, path: str) -> dict | None:
+        entry = self.entries.get(os.path.basename(path))
+        if entry and tuple(entry["signature"]) == self.signature(path):
+            return entry["summary"]
+        return None
+
+    def put(self, path: str, summary: dict) -> None:
+        self.entries[os.path.basename(path)] = {"signature": self.signature(path), "summary": summary}
+
+    def save(self, file_names: List[str]) -> None:
+        """Writes the entries of `file_names`, dropping those of deleted sessions"""
+
+        files = {name: self.entries[name] for name in file_names if name in self.entries}
+        with open(self.path, "w") as cache_file:
+            json.dump({"version": CACHE_VERSION, "files": files}, cache_file)
+
+
+def summarize_all(paths: List[str], cache: SummaryCache | None, workers: int | None) -> Tuple[Dict[str, dict], int]:
+    """Returns the summary of every session directory or file and how many of them had to be read"""
+
+    summaries = {}
+    stale = []
+    for path in paths:
+        summary = cache.get(path) if cache else None
+        if summary is None:
+            stale.append(path)
+        else:
+            summaries[path] = summary
+
+    if len(stale) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed = list(pool.map(summarize, stale))
+    else:
+        parsed = [summarize(path) for path in stale]
+
+    for path, summary in zip(stale, parsed):
+        summaries[path] = summary
+        if cache:
+            cache.put(path, summary)
+    return summaries, len(stale)
+
+
+class Aggregate:
+    """Handover and gaze figures of one participant or condition"""
+
+    def __init__(self):
+        self.sessions = 0
+        self.handovers = 0
+        self.errors = 0
+        self.init_to_bowl: List[float] = []
+        self.bowl_to_bowl: List[float] = []
+        self.dwell: Dict[str, float] = {}
+        self.fixations: Dict[str, int] = {}
+
+    def add(self, summary: dict) -> None:
+        if "handover" in summary:
+            handover = summary["handover"]
+            self.sessions += 1
+            self.handovers += handover["handovers"]
+            self.errors += handover["errors"]
+            self.init_to_bowl += handover["init_to_bowl"]
+            self.bowl_to_bowl += handover["bowl_to_bowl"]
+        if "gaze" in summary:
+            gaze = summary["gaze"]
+            for target, dwell in gaze["dwell"].items():
+                self.dwell[target] = self.dwell.get(target, 0.0) + dwell
+                self.fixations[target] = self.fixations.get(target, 0) + gaze["fixations"][target]
+
+    def row(self, targets: List[str]) -> List:
+        init_to_bowl, bowl_to_bowl = np.array(self.init_to_bowl), np.array(self.bowl_to_bowl)
+        total_dwell = sum(self.dwell.values())
+        row = [
+            self.sessions,
+            self.handovers,
+            self.errors,
+            self.errors / self.handovers if self.handovers else None,
+            *statistics(init_to_bowl),
+            *statistics(bowl_to_bowl),
+        ]
+        for target in targets:
+            dwell = self.dwell.get(target, 0.0)
+            row += [dwell, dwell / total_dwell if total_dwell else None, self.fixations.get(target, 0)]
+        return row
+
+
+def statistics(values: np.ndarray) -> List[float | None]:
+    """Mean, median and standard deviation in ms"""
+
+    if not len(values):
+        return [None, None, None]
+    return [float(np.mean(values)), float(np.median(values)), float(np.std(values))]
+
+
+def header(key_columns: List[str], targets: List[str]) -> List[str]:
+    columns = key_columns + ["sessions", "handovers", "errors", "error_rate"]
+    for duration in ["init_to_bowl", "bowl_to_bowl"]:
+        columns += [f"{duration}_mean", f"{duration}_median", f"{duration}_std"]
+    for target in targets:
+        columns += [f"dwell_{target}", f"dwell_share_{target}", f"fixations_{target}"]
+    return columns
+
+
+def aggregate(summaries: Dict[str, dict]) -> Tuple[Dict[tuple, Aggregate], Dict[tuple, Aggregate]]:
+    participants: Dict[tuple, Aggregate] = {}
+    conditions: Dict[tuple, Aggregate] = {}
+    for path, summary in sorted(summaries.items()):
+        name = os.path.basename(path)
+        match = SESSION_DIRECTORY.match(name) or SESSION_FILE.match(name)
+        condition = (match["condition"], bool(match["demo"]))
+        participants.setdefault((match["participant"], *condition), Aggregate()).add(summary)
+        conditions.setdefault(condition, Aggregate()).add(summary)
+    return participants, conditions
+
+
+def session_entries(directory: str, include_demo: bool) -> List[str]:
+    """Session directories, plus the CSV files of sessions that have no session directory"""
+
+    names = sorted(os.listdir(directory))
+    sessions = [
+        name for name in names
+        if (match := SESSION_DIRECTORY.match(name)) and is_session(os.path.join(directory, name))
+    ]
+    csv_files = [
+        name for name in names
+        if (match := SESSION_FILE.match(name)) and name[:match.start("kind") - 1] not in sessions
+    ]
+    return [
+        name for name in sorted(sessions + csv_files)
+        if include_demo or not (SESSION_DIRECTORY.match(name) or SESSION_FILE.match(name))["demo"]
+    ]
+
+
+def write_csv(path: str, columns: List[str], rows: List[List]) -> None:
+    with open(path, "w") as csv_file:
+        writer = csv.writer(csv_file, delimiter=',')
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregate the session CSV files per participant and condition")
+    parser.add_argument("--output-directory", default=OUTPUT_DIRECTORY, help="directory with the stored sessions")
+    parser.add_argument("--include-demo", action="store_true", help="include demonstration sessions")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--no-cache", action="store_true", help="read every session again")
+    args = parser.parse_args()
+
+    file_names = session_entries(args.output_directory, args.include_demo)
+    if not file_names:
+        print(f"No sessions in {args.output_directory}")
+        sys.exit(1)
+
+    cache = None if args.no_cache else SummaryCache(os.path.join(args.output_directory, CACHE_FILE))
+    paths = [os.path.join(args.output_directory, name) for name in file_names]
+    summaries, parsed = summarize_all(paths, cache, args.workers)
+    if cache:
+        cache.save(file_names)
+
+    participants, conditions = aggregate(summaries)
+    targets = sorted({target for row in participants.values() for target in row.dwell})
+    write_csv(
+        os.path.join(args.output_directory, PARTICIPANTS_FILE),
+        header(["participant", "condition", "demo"], targets),
+        [[*key, *row.row(targets)] for key, row in participants.items()],
+    )
+    write_csv(
+        os.path.join(args.output_directory, CONDITIONS_FILE),
+        header(["condition", "demo"], targets),
+        [[*key, *row.row(targets)] for key, row in conditions.items()],
+    )
+
+    print(f"{len(file_names)} sessions and files, {parsed} read, {len(file_names) - parsed} cached")
+    for (condition, demo), row in conditions.items():
+        init_to_bowl = statistics(np.array(row.init_to_bowl))[0]
+        error_rate = row.errors / row.handovers if row.handovers else 0
+        print(
+            f"{condition}{' (demo)' if demo else ''}: {row.sessions} sessions, {row.handovers} handovers, "
+            f"error rate {error_rate:.1%}, init to bowl {init_to_bowl or 0:,.0f} ms"
+        )
+    print(f"Written to {PARTICIPANTS_FILE} and {CONDITIONS_FILE} in {args.output_directory}")
@@ -0,0 +1,134 @@
+"""End-to-end HTTP throughput of /gaze_target and /event.
+
+The state machine runs in uvicorn on a free local port, the gaze animation (2222) and robot controller (3333)
+are replaced by local stand-in servers, so every transition is delivered over real connections.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Tuple
+
+import requests
+import uvicorn
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+
+REQUESTS = 2000
+CLIENTS = (1, 8)
+SESSION_ID = "benchmark"
+
+GAZE_TARGETS = ["robot_face", "left_handover_location", "right_handover_location", "packaging_area"]
+# one full handover per cycle, every request causes a transition
+HANDOVER_CYCLE: List[Tuple[str, dict]] = [
+    ("event", {"name": "handover_start_detected_left"}),
+    ("arm_location", {"location": "handover_location"}),
+    ("event", {"name": "object_in_bowl"}),
+    ("arm_location", {"location": "packaging"}),
+    ("event", {"name": "handover_finished"}),
+]
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Accepts every program like the gaze animation and robot controller do"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.received += 1
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stand_in() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.received = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_state_machine() -> Tuple[uvicorn.Server, threading.Thread, str]:
+    import main
+
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=0, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+def send(base_url: str, requests_per_client: int, clients: int, build) -> Tuple[float, List[float]]:
+    """Returns requests/s and the latencies in ms of `clients` keep-alive clients sending concurrently"""
+
+    def client(offset: int) -> List[float]:
+        latencies = []
+        with requests.Session() as session:
+            for index in range(requests_per_client):
+                path, payload = build(offset + index)
+                start = time.perf_counter()
+                session.post(f"{base_url}/sessions/{SESSION_ID}/{path}", json=payload).raise_for_status()
+                latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = [latency for result in pool.map(client, range(clients)) for latency in result]
+    return len(latencies) / (time.perf_counter() - start), latencies
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def results(total_requests: int = REQUESTS, clients: Tuple[int, ...] = CLIENTS) -> List[dict]:
+    directory = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+    gaze_animation, robot_controller = start_stand_in(), start_stand_in()
+    server, thread, base_url = start_state_machine()
+    try:
+        requests.post(f"{base_url}/sessions", json={
+            "session_id": SESSION_ID,
+            "participant_identifier": "benchmark",
+            "dynamic_gaze": True,
+            "robot_controller_url": f"http://127.0.0.1:{robot_controller.server_port}/start",
+            "gaze_animation_url": f"http://127.0.0.1:{gaze_animation.server_port}/trigger",
+        }).raise_for_status()
+
+        endpoints = {
+            "gaze_target": lambda index: ("gaze_target", {"target": GAZE_TARGETS[index % len(GAZE_TARGETS)]}),
+            "event": lambda index: HANDOVER_CYCLE[index % len(HANDOVER_CYCLE)],
+        }
+        output = []
+        for endpoint, build in endpoints.items():
+            for client_count in clients:
+                throughput, latencies = send(base_url, total_requests // client_count, client_count, build)
+                params = {"endpoint": endpoint, "clients": client_count}
+                output += [
+                    {"name": "http_throughput", "params": params, "value": throughput, "unit": "requests/s", "higher_is_better": True},
+                    {"name": "http_latency_p50", "params": params, "value": percentile(latencies, 0.5), "unit": "ms", "higher_is_better": False},
+                    {"name": "http_latency_p99", "params": params, "value": percentile(latencies, 0.99), "unit": "ms", "higher_is_better": False},
+                ]
+        return output
+    finally:
+        server.should_exit = True
+        thread.join()
+        gaze_animation.shutdown()
+        robot_controller.shutdown()
+        os.chdir(directory)
+
+
+if __name__ == "__main__":
+    for result in results():
+        print(f"{result['name']:<18}{result['params']['endpoint']:<13}{result['params']['clients']:>3} clients: {result['value']:>10,.2f} {result['unit']}")
@@ -0,0 +1,71 @@
+"""Queue wait of a handover event submitted behind a backlog of gaze targets.
+
+The actor is driven directly: a burst of gaze targets is queued, then one handover event. Every update
+costs UPDATE_COST_MS of simulated session work (logging, notifying), so the backlog takes real time to
+drain; the handover event's lane lets it skip the backlog.
+"""
+import asyncio
+import os
+import sys
+import time
+from typing import List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from actor import StateMachineActor, QueuedUpdate
+from fsm import StateMachine, StateUpdate, GazeTarget
+from update_state import NullLogger
+
+
+BACKLOGS = (10, 100, 1000)
+UPDATE_COST_MS = 0.05
+GAZE_TARGETS = [GazeTarget.ROBOT_FACE, GazeTarget.PACKAGING_AREA, GazeTarget.LEFT_HANDOVER_LOCATION]
+
+
+def simulate_work(update, changes) -> None:
+    end = time.perf_counter() + UPDATE_COST_MS / 1000
+    while time.perf_counter() < end:
+        pass
+
+
+async def measure(backlog: int) -> dict:
+    """Returns the queue wait in ms of the handover event and the gaze targets"""
+
+    actor = StateMachineActor(StateMachine(logger=NullLogger(), dynamic_gaze=True), on_changes=simulate_work, session_id="benchmark")
+    actor.start()
+    gaze: List[QueuedUpdate] = [
+        actor.submit(StateUpdate(new_gaze_target=GAZE_TARGETS[index % len(GAZE_TARGETS)])) for index in range(backlog)
+    ]
+    handover = actor.submit(StateUpdate(object_in_bowl=True))
+    while not actor.queue.empty():
+        await asyncio.sleep(0.001)
+    await actor.stop()
+
+    gaze_waits = sorted((item.dequeued_at - item.enqueued_at) * 1000 for item in gaze)
+    return {
+        "handover": (handover.dequeued_at - handover.enqueued_at) * 1000,
+        "gaze_p50": gaze_waits[len(gaze_waits) // 2],
+        "gaze_max": gaze_waits[-1],
+    }
+
+
+def results(backlogs: List[int] = BACKLOGS) -> List[dict]:
+    output = []
+    for backlog in backlogs:
+        waits = asyncio.run(measure(backlog))
+        for name, value in waits.items():
+            output.append({
+                "name": f"priority_lanes_{name}_wait",
+                "params": {"gaze_backlog": backlog},
+                "value": value,
+                "unit": "ms",
+                "higher_is_better": False,
+            })
+    return output
+
+
+if __name__ == "__main__":
+    print(f"{'gaze backlog':>12}{'handover wait':>16}{'gaze wait p50':>16}{'gaze wait max':>16}  [ms]")
+    for backlog in BACKLOGS:
+        waits = asyncio.run(measure(backlog))
+        print(f"{backlog:>12}{waits['handover']:>16.3f}{waits['gaze_p50']:>16.3f}{waits['gaze_max']:>16.3f}")
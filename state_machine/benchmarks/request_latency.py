@@ -0,0 +1,96 @@
+"""Request latency of the state machine endpoints, queued (default) against inline (`?wait=true`).
+
+Requests go through the ASGI app in-process, so the numbers contain routing and validation but no network.
+For the queued path both the response latency and the latency until the transition is applied are reported;
+the inline path only responds once the transition is applied.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from typing import List, Tuple
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+# session data of the benchmark is written to a throwaway directory
+os.environ.setdefault("PARTICIPANT_IDENTIFIER", "benchmark")
+os.chdir(tempfile.mkdtemp())
+
+import main
+from sessions import DEFAULT_SESSION_ID
+
+
+CYCLES = 200
+
+# one full handover per cycle, every request causes a transition
+HANDOVER_CYCLE: List[Tuple[str, dict]] = [
+    ("/event", {"name": "handover_start_detected_left"}),
+    ("/arm_location", {"location": "handover_location"}),
+    ("/event", {"name": "object_in_bowl"}),
+    ("/arm_location", {"location": "packaging"}),
+    ("/event", {"name": "handover_finished"}),
+]
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def measure(client: httpx.AsyncClient, wait: bool) -> Tuple[List[float], List[float]]:
+    """Returns the response and the applied latencies in ms"""
+
+    actor = main.registry.get(DEFAULT_SESSION_ID).actor
+    responses, applied = [], []
+    for _ in range(CYCLES):
+        for path, payload in HANDOVER_CYCLE:
+            start = time.perf_counter()
+            response = await client.post(path, params={"wait": wait}, json=payload)
+            responses.append((time.perf_counter() - start) * 1000)
+            response.raise_for_status()
+            while not actor.queue.empty():
+                await asyncio.sleep(0)
+            applied.append((time.perf_counter() - start) * 1000)
+    return responses, applied
+
+
+async def run() -> List[Tuple[str, List[float], List[float]]]:
+    """Returns (mode, response latencies, applied latencies) of the queued and the inline mode"""
+
+    main.registry.start(asyncio.get_running_loop())
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://state-machine") as client:
+        # warm up routing and validation
+        await measure(client, wait=True)
+        modes = [("queued", *await measure(client, wait=False)), ("inline", *await measure(client, wait=True))]
+    await main.registry.stop()
+    return modes
+
+
+def results() -> List[dict]:
+    output = []
+    for mode, responses, applied in asyncio.run(run()):
+        for name, latencies in (("response", responses), ("applied", applied)):
+            for q in (0.5, 0.99):
+                output.append({
+                    "name": f"request_latency_{name}_p{int(q * 100)}",
+                    "params": {"mode": mode},
+                    "value": percentile(latencies, q),
+                    "unit": "ms",
+                    "higher_is_better": False,
+                })
+    return output
+
+
+if __name__ == "__main__":
+    modes = asyncio.run(run())
+    print(f"\n{len(HANDOVER_CYCLE) * CYCLES} requests per mode")
+    print(f"{'mode':<10}{'response p50':>14}{'response p99':>14}{'applied p50':>14}{'applied p99':>14}  [ms]")
+    for mode, responses, applied in modes:
+        print(
+            f"{mode:<10}{percentile(responses, 0.5):>14.3f}{percentile(responses, 0.99):>14.3f}"
+            f"{percentile(applied, 0.5):>14.3f}{percentile(applied, 0.99):>14.3f}"
+        )
@@ -0,0 +1,132 @@
+"""Runs the benchmark suite and writes the results as JSON.
+
+    python benchmarks/run.py [--quick] [--only update_state write_files] [--output results.json]
+    python benchmarks/run.py --compare benchmarks/results/baseline.json
+
+Every benchmark runs in a fresh process, so module level state of one (e.g. the FastAPI app and its
+session registry) does not influence the next. With --compare, each result is matched against the
+baseline by name and params and the run fails if any got worse by more than --threshold.
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+
+BENCHMARKS_DIR = os.path.dirname(os.path.realpath(__file__))
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+THRESHOLD = 0.2
+
+# benchmark module: (arguments of the full run, arguments of --quick)
+BENCHMARKS: Dict[str, Tuple[dict, dict]] = {
+    "update_state": ({}, {"count": 500}),
+    "write_files": ({}, {"sizes": (10_000, 100_000)}),
+    "request_latency": ({}, {}),
+    "http_throughput": ({}, {"total_requests": 400}),
+    "priority_lanes": ({}, {"backlogs": (10, 100)}),
+}
+
+
+def run_benchmark(name: str, kwargs: dict, verbose: bool, connection) -> None:
+    sys.path.insert(0, BENCHMARKS_DIR)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(sys.stdout if verbose else devnull):
+        module = __import__(name)
+        connection.send(module.results(**kwargs))
+
+
+def run_isolated(name: str, kwargs: dict, verbose: bool) -> List[dict]:
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=run_benchmark, args=(name, kwargs, verbose, sender))
+    process.start()
+    sender.close()
+    try:
+        results = receiver.recv()
+    except EOFError:
+        raise RuntimeError(f"benchmark {name} failed") from None
+    finally:
+        process.join()
+    return results
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=BENCHMARKS_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def key(result: dict) -> str:
+    return f"{result['name']} {json.dumps(result['params'], sort_keys=True)}"
+
+
+def compare(results: List[dict], baseline: List[dict], threshold: float) -> List[str]:
+    """Returns a line for every result that is worse than its baseline by more than `threshold`"""
+
+    previous = {key(result): result["value"] for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get(key(result))
+        if not before:
+            continue
+        change = (result["value"] - before) / before
+        worse = -change if result["higher_is_better"] else change
+        if worse > threshold:
+            regressions.append(f"{key(result)}: {before:.4g} -> {result['value']:.4g} {result['unit']} ({change:+.1%})")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Runs the state machine benchmarks")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS), help="benchmarks to run")
+    parser.add_argument("--quick", action="store_true", help="smaller workloads, for a fast sanity check")
+    parser.add_argument("--output", help="result file, defaults to benchmarks/results/<time>.json")
+    parser.add_argument("--compare", help="baseline result file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="relative change counted as regression")
+    parser.add_argument("--verbose", action="store_true", help="show the output of the benchmarks")
+    args = parser.parse_args()
+
+    started = datetime.now()
+    results = []
+    for name in args.only:
+        print(f"running {name}", flush=True)
+        full, quick = BENCHMARKS[name]
+        for result in run_isolated(name, quick if args.quick else full, args.verbose):
+            results.append({"benchmark": name, **result})
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{started.strftime('%Y-%m-%d_%H-%M-%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump({
+            "meta": {
+                "time": started.isoformat(),
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "quick": args.quick,
+            },
+            "results": results,
+        }, file, indent=2)
+    print(f"{len(results)} results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file)["results"], args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print(f"no regressions above {args.threshold:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
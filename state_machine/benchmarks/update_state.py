@@ -0,0 +1,186 @@
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from enum import Enum
+from typing import List, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from fsm import (
+    StateMachine, StateUpdate, UpdatedState, HandoverState, GazeProgram, EVENT_KEYS
+)
+
+
+ROUNDS = 50
+REPEATS = 5
+MEMORY_SAMPLES = 10000
+# updates per combination in results()
+COMBINATION_UPDATES = 2000
+
+
+class NullLogger:
+    def log_handover_initiation(self) -> None:
+        pass
+
+    def log_object_in_bowl(self) -> None:
+        pass
+
+    def log_handover_error(self) -> None:
+        pass
+
+
+class LinearStateMachine(StateMachine):
+    """Dispatch without the compiled tables: every rule of the current state is matched in spec order"""
+
+    def update_state(self, u: StateUpdate) -> UpdatedState:
+        changes = UpdatedState()
+        hs, gp = self.state.current_handover_state, self.state.current_gaze_program
+
+        if not any([u.new_gaze_target, u.gaze_program_finished, u.state_loop_update]):
+            for rule in self.policy.handover_rules[hs.index]:
+                if rule.matches(u):
+                    self.state.current_handover_state = rule.dst
+                    changes.handover_state = rule.dst
+                    if rule.arm_program is not None:
+                        changes.arm_program = rule.arm_program
+                    if rule.gaze_program is not None:
+                        self.state.current_gaze_program = rule.gaze_program
+                        changes.gaze_program = rule.gaze_program
+                    break
+
+            if u.new_arm_location:
+                self.state.last_arm_location = u.new_arm_location
+
+        if u.handover_start_detected and changes.handover_state in [HandoverState.MOVING_TO_PERSON_LEFT, HandoverState.MOVING_TO_PERSON_RIGHT]:
+            self.logger.log_handover_initiation()
+        elif u.object_in_bowl and changes.handover_state in [HandoverState.MOVING_TO_PACKAGING_LEFT, HandoverState.MOVING_TO_PACKAGING_RIGHT]:
+            self.logger.log_object_in_bowl()
+        elif u.error_during_handover and changes.handover_state in [HandoverState.ERROR_LEFT, HandoverState.ERROR_RIGHT]:
+            self.logger.log_handover_error()
+
+        if not self.dynamic_gaze and changes.handover_state:
+            self.state.current_gaze_program = self.policy.static_gaze[changes.handover_state.index]
+            changes.gaze_program = self.state.current_gaze_program
+            return changes
+
+        if self.dynamic_gaze and any([u.new_gaze_target, u.gaze_program_finished, u.state_loop_update]):
+            for rule in self.policy.gaze_rules[hs.index][gp.index]:
+                if rule.matches(u) or (
+                    rule.timeout is not None
+                    and (self.clock.now() - self.state.last_gaze_update).total_seconds() >= rule.timeout
+                ):
+                    self.state.current_gaze_program = rule.dst
+                    changes.gaze_program = rule.dst
+                    self.state.last_gaze_update = self.clock.now()
+                    break
+
+        return changes
+
+
+def build_updates() -> List[StateUpdate]:
+    return [StateUpdate(**{field: value}) for field, value in EVENT_KEYS]
+
+
+def measure(sm: StateMachine, hs: HandoverState, updates: List[StateUpdate]) -> float:
+    """Returns the best updates/sec for every event key applied to every gaze program reachable in `hs`"""
+
+    programs = [gp for gp in GazeProgram if sm.policy.gaze_rules[hs.index][gp.index]] or [sm.policy.static_gaze[hs.index]]
+    state = sm.state
+    best = 0.0
+    for _ in range(REPEATS):
+        last_gaze_update = datetime.now()
+        count = 0
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            for gp in programs:
+                for update in updates:
+                    state.current_handover_state = hs
+                    state.current_gaze_program = gp
+                    state.last_gaze_update = last_gaze_update
+                    sm.update_state(update)
+                    count += 1
+        best = max(best, count / (time.perf_counter() - start))
+    return best
+
+
+def memory_per_update(dynamic_gaze: bool) -> float:
+    """Returns the bytes held per update by a StateUpdate and the UpdatedState it produced"""
+
+    sm = StateMachine(logger=NullLogger(), dynamic_gaze=dynamic_gaze)
+    fields = [(field, value) for field, value in EVENT_KEYS]
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    held = []
+    for i in range(MEMORY_SAMPLES):
+        field, value = fields[i % len(fields)]
+        update = StateUpdate(**{field: value})
+        held.append((update, sm.update_state(update)))
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # the list holding the samples is not part of an update
+    return (after - before - sys.getsizeof(held) - sys.getsizeof((None, None)) * MEMORY_SAMPLES) / MEMORY_SAMPLES
+
+
+def measure_combination(sm: StateMachine, hs: HandoverState, update: StateUpdate, count: int) -> float:
+    """Returns the best updates/sec of one event applied in `hs`, cycling through its reachable gaze programs"""
+
+    programs = [gp for gp in GazeProgram if sm.policy.gaze_rules[hs.index][gp.index]] or [sm.policy.static_gaze[hs.index]]
+    state = sm.state
+    best = 0.0
+    for _ in range(REPEATS):
+        last_gaze_update = datetime.now()
+        start = time.perf_counter()
+        for index in range(count):
+            state.current_handover_state = hs
+            state.current_gaze_program = programs[index % len(programs)]
+            state.last_gaze_update = last_gaze_update
+            sm.update_state(update)
+        best = max(best, count / (time.perf_counter() - start))
+    return best
+
+
+def results(count: int = COMBINATION_UPDATES) -> List[dict]:
+    """update_state throughput of every handover state and event in both gaze modes, and memory per update"""
+
+    output = []
+    for dynamic_gaze in (False, True):
+        sm = StateMachine(logger=NullLogger(), dynamic_gaze=dynamic_gaze)
+        for hs in HandoverState:
+            for (field, value), update in zip(EVENT_KEYS, build_updates()):
+                output.append({
+                    "name": "update_state",
+                    "params": {
+                        "dynamic_gaze": dynamic_gaze,
+                        "handover_state": hs.value,
+                        "event": f"{field}={value.value if isinstance(value, Enum) else value}",
+                    },
+                    "value": measure_combination(sm, hs, update, count),
+                    "unit": "updates/s",
+                    "higher_is_better": True,
+                })
+        output.append({
+            "name": "update_state_memory",
+            "params": {"dynamic_gaze": dynamic_gaze},
+            "value": memory_per_update(dynamic_gaze),
+            "unit": "B",
+            "higher_is_better": False,
+        })
+    return output
+
+
+def run(dynamic_gaze: bool) -> List[Tuple[str, float, float]]:
+    updates = build_updates()
+    before = LinearStateMachine(logger=NullLogger(), dynamic_gaze=dynamic_gaze)
+    after = StateMachine(logger=NullLogger(), dynamic_gaze=dynamic_gaze)
+    return [(hs.value, measure(before, hs, updates), measure(after, hs, updates)) for hs in HandoverState]
+
+
+if __name__ == "__main__":
+    for dynamic_gaze in (False, True):
+        print(f"\nDynamic Gaze: {dynamic_gaze}")
+        print(f"{'handover state':<28}{'before [upd/s]':>16}{'after [upd/s]':>16}{'speedup':>10}")
+        for name, before, after in run(dynamic_gaze):
+            print(f"{name:<28}{before:>16,.0f}{after:>16,.0f}{after / before:>9.2f}x")
+        print(f"memory per update: {memory_per_update(dynamic_gaze):,.0f} B")
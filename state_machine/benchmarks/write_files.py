@@ -0,0 +1,98 @@
+"""Time of DataLogger.write_files for sessions with many gaze target records, and of reading them back.
+
+The records are appended through the regular event log beforehand, only deriving the session store (and
+the CSV export) is timed. Reading compares loading the gaze durations from the session store with parsing
+the gaze CSV file.
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from analytics import read_columns, numeric
+from data_logger import DataLogger
+from fsm import GazeTarget
+from session_store import SessionData
+
+
+SIZES = (10_000, 100_000, 1_000_000)
+HANDOVERS = 20
+
+
+def build_logger(records: int, export_csv: bool) -> DataLogger:
+    logger = DataLogger(
+        participant_identifier=f"benchmark_{records}_{'csv' if export_csv else 'store'}", dynamic_gaze=True, demonstration=False, export_csv=export_csv
+    )
+    targets = [target.value for target in GazeTarget]
+    start = datetime(2025, 1, 1)
+    for index in range(records):
+        logger.event_log.append("gaze_target", start + timedelta(milliseconds=index * 200), {"target": targets[index % len(targets)]})
+    for index in range(HANDOVERS):
+        logger.event_log.append("handover_initiation", start + timedelta(seconds=index * 30))
+        logger.event_log.append("object_in_bowl", start + timedelta(seconds=index * 30 + 10))
+    logger.event_log.flush()
+    return logger
+
+
+def measure(records: int, export_csv: bool) -> float:
+    """Returns the seconds write_files takes for a session with `records` gaze targets"""
+
+    logger = build_logger(records, export_csv)
+    try:
+        start = time.perf_counter()
+        logger.write_files()
+        return time.perf_counter() - start
+    finally:
+        logger.close()
+
+
+def measure_read(records: int) -> Tuple[float, float]:
+    """Returns the seconds to get the gaze durations of the session written by measure() from the session
+    store and from the CSV file"""
+
+    directory = f"./output/benchmark_{records}_csv_dynamic"
+    start = time.perf_counter()
+    SessionData(directory).gaze_durations()
+    store = time.perf_counter() - start
+
+    start = time.perf_counter()
+    numeric(read_columns(f"{directory}_gaze.csv")["duration"])
+    return store, time.perf_counter() - start
+
+
+def results(sizes: List[int] = SIZES) -> List[dict]:
+    directory = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+    try:
+        output = []
+        for records in sizes:
+            for export_csv in (False, True):
+                output.append({
+                    "name": "write_files",
+                    "params": {"gaze_records": records, "export_csv": export_csv},
+                    "value": measure(records, export_csv),
+                    "unit": "s",
+                    "higher_is_better": False,
+                })
+            for source, seconds in zip(("store", "csv"), measure_read(records)):
+                output.append({
+                    "name": "read_session",
+                    "params": {"gaze_records": records, "source": source},
+                    "value": seconds,
+                    "unit": "s",
+                    "higher_is_better": False,
+                })
+        return output
+    finally:
+        os.chdir(directory)
+
+
+if __name__ == "__main__":
+    for result in results():
+        params = result["params"]
+        variant = f"export_csv={params['export_csv']}" if "export_csv" in params else f"from {params['source']}"
+        print(f"{result['name']:<14}{params['gaze_records']:>10,} gaze records, {variant:<17}: {result['value']:.4f} s")
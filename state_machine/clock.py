@@ -0,0 +1,21 @@
+from datetime import datetime
+
+
+class Clock:
+    """Source of the current time for all time-based state machine decisions"""
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+
+class VirtualClock(Clock):
+    """Clock that only moves when told to, used to replay recorded sessions faster than real time"""
+
+    def __init__(self, start: datetime):
+        self.current = start
+
+    def now(self) -> datetime:
+        return self.current
+
+    def advance_to(self, timestamp: datetime) -> None:
+        self.current = max(self.current, timestamp)
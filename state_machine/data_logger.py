@@ -1,38 +1,33 @@
-import csv
 from datetime import datetime
 import os
-from typing import List
 
+from event_log import EventLogWriter
+from session_store import GazeTimeline, SessionData, write_session_from_log, export_csv
 
-OUTPUT_DIRECTORY = "./output"
-
-
-class HandoverTimings:
-   def __init__(self):
-      self.initiation_timestamp: datetime | None = None
-      self.object_in_bowl_timestamp: datetime | None = None
-      self.error_occured: bool | None = None
 
-
-class GazeTargetTiming:
-   def __init__(self, gaze_target: str):
-      self.gaze_target: str = gaze_target
-      self.start_timestamp: datetime = datetime.now()
+OUTPUT_DIRECTORY = "./output"
 
 
 class DataLogger:
-    def __init__(self, participant_identifier: str, dynamic_gaze: bool, demonstration: bool):
-        self.file_name = self.create_base_file_name(participant_identifier, dynamic_gaze, demonstration)
+    """Records session events to an append-only event log, the session store and CSV files are derived from that log.
 
-        self.gaze_target_timings: List[GazeTargetTiming] = []
+    Logging only enqueues a record for the background writer, the log survives a crash of the process.
+    """
 
-        self.handover_timings: List[HandoverTimings] = []
+    def __init__(self, participant_identifier: str, dynamic_gaze: bool, demonstration: bool, export_csv: bool = False):
+        self.export_csv = export_csv
+        self.file_name = self.create_base_file_name(participant_identifier, dynamic_gaze, demonstration)
 
-        self.task_completed_timestamp: datetime | None = None
+        # reused by every write_files(), keeps its fixed capacity
+        self.gaze_timeline = GazeTimeline(self.spill_directory())
 
         self.setup()
 
-    def create_base_file_name(self, participant_identifier: str, dynamic_gaze: bool, demonstration: bool) -> str:
+        self.event_log = EventLogWriter(self.event_log_path())
+        self.log_session(participant_identifier, dynamic_gaze, demonstration)
+
+    @staticmethod
+    def create_base_file_name(participant_identifier: str, dynamic_gaze: bool, demonstration: bool) -> str:
         base_file_name = participant_identifier
 
         if dynamic_gaze:
@@ -45,100 +40,79 @@ class DataLogger:
         
         return base_file_name
     
-    def update_file_name(self, participant_identifier: str, dynamic_gaze: bool, demonstration: bool) -> None:
-        self.file_name = self.create_base_file_name(participant_identifier, dynamic_gaze, demonstration)
+    def event_log_path(self, file_name: str | None = None) -> str:
+        return f"{OUTPUT_DIRECTORY}/{file_name or self.file_name}_events.jsonl"
+
+    def update_file_name(self, participant_identifier: str, dynamic_gaze: bool, demonstration: bool) -> str | None:
+        """Logs to the files of the new configuration from now on.
+
+        Returns the previous file name, whose session is still to be written with write_files(), or None
+        if the file name did not change.
+        """
+        file_name = self.create_base_file_name(participant_identifier, dynamic_gaze, demonstration)
+        if file_name == self.file_name:
+            return None
+
+        # the finished session keeps its own log and CSV files
+        previous, self.file_name = self.file_name, file_name
+        self.event_log.rotate(self.event_log_path())
+        self.log_session(participant_identifier, dynamic_gaze, demonstration)
+        return previous
+
+    def log_session(self, participant_identifier: str, dynamic_gaze: bool, demonstration: bool) -> None:
+        """Marks the start of a (possibly restarted) state machine session in the event log"""
+
+        self.event_log.append("session", datetime.now(), {
+            "participant_identifier": participant_identifier,
+            "dynamic_gaze": dynamic_gaze,
+            "demonstration": demonstration,
+        })
+
+    def log_state_update(self, update: dict) -> None:
+        self.event_log.append("state_update", datetime.now(), {"update": update})
+
+    def log_transition(self, changes: dict) -> None:
+        self.event_log.append("transition", datetime.now(), {"changes": changes})
 
     def log_gaze_target(self, gaze_target: str) -> None:
-        self.gaze_target_timings.append(GazeTargetTiming(gaze_target))
+        self.event_log.append("gaze_target", datetime.now(), {"target": gaze_target})
 
     def log_handover_initiation(self) -> None:
-        self.handover_timings.append(HandoverTimings())
-        self.handover_timings[len(self.handover_timings)-1].initiation_timestamp = datetime.now()
+        self.event_log.append("handover_initiation", datetime.now())
 
     def log_object_in_bowl(self) -> None:
-        self.handover_timings[len(self.handover_timings)-1].object_in_bowl_timestamp = datetime.now()
+        self.event_log.append("object_in_bowl", datetime.now())
 
     def log_handover_error(self) -> None:
-        self.handover_timings[len(self.handover_timings)-1].error_occured = True
+        self.event_log.append("handover_error", datetime.now())
 
     def log_task_completed(self) -> None:
-        self.task_completed_timestamp = datetime.now()
-
-    def __get_handover_data(self) -> List[tuple]:
-        data = [["identifier", "initiation", "object_in_bowl", "init_to_bowl_duration", "error", "bowl_to_bowl_duration", "full_duration"]]
-        for index, handover in enumerate(self.handover_timings):
-            name = f"handover_{index+1}"
-
-            init_to_bowl_duration = None
-            if handover.object_in_bowl_timestamp:
-                init_to_bowl_duration = (handover.object_in_bowl_timestamp-handover.initiation_timestamp).total_seconds() * 1000
-
-            bowl_to_bowl_duration = None
-            if index > 0 and handover.object_in_bowl_timestamp:
-                previous_object_in_bowl_timestamp = self.handover_timings[index-1].object_in_bowl_timestamp
-                if previous_object_in_bowl_timestamp:
-                    bowl_to_bowl_duration = (handover.object_in_bowl_timestamp-previous_object_in_bowl_timestamp).total_seconds() * 1000
-
-            next_initiation_timestamp = self.task_completed_timestamp
-            if index < len(self.handover_timings)-1:
-                next_initiation_timestamp = self.handover_timings[index+1].initiation_timestamp
-
-            full_duration = None
-            if next_initiation_timestamp:
-                full_duration = (next_initiation_timestamp-handover.initiation_timestamp).total_seconds() * 1000
-            
-            data.append(
-                [
-                    name,
-                    handover.initiation_timestamp.isoformat(),
-                    (handover.object_in_bowl_timestamp.isoformat() if handover.object_in_bowl_timestamp else None),
-                    init_to_bowl_duration,
-                    handover.error_occured,
-                    bowl_to_bowl_duration,
-                    full_duration
-                ]
-            )
-
-        return data
-
-    def __get_gaze_data(self) -> List[tuple]:
-        data = [["target", "start_time", "duration"]]
-        for index, gaze_target in enumerate(self.gaze_target_timings):
-            duration = None
-            if index < len(self.gaze_target_timings)-1:
-                next_start_time = self.gaze_target_timings[index+1].start_timestamp
-                duration = (next_start_time-gaze_target.start_timestamp).total_seconds() * 1000
-
-            data.append(
-                [
-                    gaze_target.gaze_target,
-                    gaze_target.start_timestamp,
-                    duration
-                ]
-            )
-
-        return data
-
-    # def __get_analysis_data(self) -> List[tuple]:
-    #     pass
-
-    def __write_file(self, data: List[tuple], file_name_suffix: str | None = None) -> None:
-        file_name = f"{self.file_name}_{file_name_suffix}" if file_name_suffix else self.file_name
-        with open(f"{OUTPUT_DIRECTORY}/{file_name}.csv", "w") as csv_file:  
-            writer = csv.writer(csv_file, delimiter=',')
-            for line in data:
-                writer.writerow(line)
-
-    def write_files(self) -> None:
+        self.event_log.append("task_completed", datetime.now())
+
+    def session_directory(self, file_name: str | None = None) -> str:
+        return f"{OUTPUT_DIRECTORY}/{file_name or self.file_name}"
+
+    def spill_directory(self, file_name: str | None = None) -> str:
+        return f"{self.session_directory(file_name)}/spill"
+
+    def write_files(self, file_name: str | None = None) -> None:
+        """Writes the session `file_name` (default: the current one) in the columnar session store, and as
+        CSV files if `export_csv` is set. Blocks on the event log and the disk, so the server runs it in a thread.
+        """
+
         print("DataLogger: Logging Data")
-        if self.handover_timings:
-            self.__write_file(self.__get_handover_data(), "handover")
-            print("DataLogger: Logged Handover Data")
-        if self.gaze_target_timings:
-            self.__write_file(self.__get_gaze_data(), "gaze")
-            print("DataLogger: Logged Gaze Data")
-        #self.__write_file(self.__get_analysis_data(), "analysis")
+        self.event_log.flush()
+        session_directory = self.session_directory(file_name)
+        if not write_session_from_log(self.event_log_path(file_name), session_directory, self.gaze_timeline):
+            return
+        print(f"DataLogger: Logged Session Data to {session_directory}")
+        if self.export_csv:
+            for path in export_csv(SessionData(session_directory), session_directory):
+                print(f"DataLogger: Exported {path}")
+
+    def close(self) -> None:
+        self.event_log.close()
 
     def setup(self):
         os.makedirs(OUTPUT_DIRECTORY, exist_ok=True)
-        
+
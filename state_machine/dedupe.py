@@ -0,0 +1,72 @@
+from collections import OrderedDict
+
+from gaze_filter import SEQUENCE_RESTART_GAP, MAX_SENDERS
+from metrics import EVENTS_DUPLICATE
+
+
+DEDUPE_WINDOW = 64
+
+
+class SenderWindow:
+    """Highest sequence number of a sender and a bitmask of which of the DEDUPE_WINDOW numbers up to it were seen"""
+
+    __slots__ = ("highest", "seen")
+
+    def __init__(self, seq: int):
+        self.highest = seq
+        self.seen = 1
+
+
+class Deduplicator:
+    """Drops retried requests so senders can retry on short timeouts without firing a transition twice.
+
+    A request carrying a sender id and sequence number is accepted once; a sequence number older than the
+    window is taken as a duplicate, unless it is so far below that the sender must have restarted.
+    Requests without sender id or sequence number are always accepted. Only the MAX_SENDERS most recently
+    active senders are remembered.
+    """
+
+    def __init__(self, session_id: str = "default", window: int = DEDUPE_WINDOW, max_senders: int = MAX_SENDERS):
+        self.session_id = session_id
+        self.window = window
+        self.max_senders = max_senders
+        self.senders: OrderedDict[str, SenderWindow] = OrderedDict()
+        self.accepted = 0
+        self.duplicates = 0
+
+    def accept(self, sender: str | None, seq: int | None, kind: str) -> bool:
+        """Returns False if the request is a duplicate, must be called on the event loop"""
+
+        if sender is None or seq is None:
+            return True
+        if self.__accept(sender, seq):
+            self.accepted += 1
+            return True
+        self.duplicates += 1
+        EVENTS_DUPLICATE.inc(self.session_id, kind)
+        return False
+
+    def summary(self) -> dict:
+        return {"senders": len(self.senders), "accepted": self.accepted, "duplicates": self.duplicates}
+
+    def __accept(self, sender: str, seq: int) -> bool:
+        window = self.senders.get(sender)
+        if window is None or seq < window.highest - SEQUENCE_RESTART_GAP:
+            self.senders[sender] = SenderWindow(seq)
+            self.senders.move_to_end(sender)
+            if len(self.senders) > self.max_senders:
+                self.senders.popitem(last=False)
+            return True
+
+        self.senders.move_to_end(sender)
+        if seq > window.highest:
+            shift = seq - window.highest
+            window.seen = ((window.seen << shift) | 1) & ((1 << self.window) - 1) if shift < self.window else 1
+            window.highest = seq
+            return True
+
+        offset = window.highest - seq
+        if offset >= self.window or window.seen >> offset & 1:
+            return False
+        window.seen |= 1 << offset
+        return True
@@ -0,0 +1,116 @@
+import json
+import os
+import queue
+import threading
+from datetime import datetime
+from typing import Iterator
+
+
+BATCH_SIZE = 256
+
+
+class Control:
+    ROTATE = "rotate"
+    FLUSH = "flush"
+    CLOSE = "close"
+
+    def __init__(self, action: str, argument=None):
+        self.action = action
+        self.argument = argument
+
+
+class EventLogWriter:
+    """Append-only JSONL log written by a background thread.
+
+    `append` only pushes the record onto a queue. The writer thread drains whatever is queued (up to
+    BATCH_SIZE records), writes it in one go and flushes and fsyncs once per batch, so a crash loses at
+    most the records that were still queued. The file is only created with the first record.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.log_file = None
+        self.queue: queue.Queue = queue.Queue()
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def append(self, kind: str, timestamp: datetime, payload: dict | None = None) -> None:
+        self.queue.put((kind, timestamp, payload or {}))
+
+    def rotate(self, path: str) -> None:
+        """Records appended after this call go to `path`"""
+
+        self.queue.put(Control(Control.ROTATE, path))
+
+    def flush(self) -> None:
+        """Blocks until every record appended so far is on disk"""
+
+        done = threading.Event()
+        self.queue.put(Control(Control.FLUSH, done))
+        done.wait()
+
+    def close(self) -> None:
+        self.queue.put(Control(Control.CLOSE))
+        self.thread.join()
+
+    def __write(self, lines: list) -> None:
+        if not lines:
+            return
+        try:
+            if self.log_file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self.log_file = open(self.path, "a")
+            self.log_file.writelines(lines)
+            self.log_file.flush()
+            os.fsync(self.log_file.fileno())
+        except OSError as e:
+            print("ERROR while writing event log: ", str(e))
+
+    def __close_file(self) -> None:
+        if self.log_file:
+            self.log_file.close()
+            self.log_file = None
+
+    def __run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = []
+            for item in batch:
+                if not isinstance(item, Control):
+                    kind, timestamp, payload = item
+                    lines.append(json.dumps({"type": kind, "time": timestamp.isoformat(), **payload}) + "\n")
+                    continue
+
+                # everything appended before a control item is written out first
+                self.__write(lines)
+                lines = []
+                if item.action == Control.ROTATE:
+                    self.__close_file()
+                    self.path = item.argument
+                elif item.action == Control.FLUSH:
+                    item.argument.set()
+                elif item.action == Control.CLOSE:
+                    self.__close_file()
+                    return
+            self.__write(lines)
+
+
+def read_event_log(path: str) -> Iterator[dict]:
+    """Yields the records of an event log with parsed timestamps, skipping a line truncated by a crash"""
+
+    if not os.path.exists(path):
+        return
+    with open(path) as log_file:
+        for line in log_file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            record["time"] = datetime.fromisoformat(record["time"])
+            yield record
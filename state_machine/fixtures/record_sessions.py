@@ -0,0 +1,104 @@
+"""Records random sessions as an event log that replay.py checks the transition spec against.
+
+    python replay.py fixtures/random_sessions_events.jsonl
+
+Every session is a seeded random sequence of events at random intervals, in both gaze modes, driven
+through the StateMachine under a virtual clock. Timeout transitions fire at their deadline exactly like
+in a replay. The committed log was recorded with the lambda transition tables that transitions.json was
+generated from, so a replay reports every rule that no longer behaves like them:
+
+    git worktree add /tmp/lambda-tables 80d78bd
+    PYTHONPATH=/tmp/lambda-tables/state_machine python fixtures/record_sessions.py
+
+Run without PYTHONPATH to record a new reference after an intended policy change.
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from clock import VirtualClock
+from event_log import EventLogWriter
+from fsm import StateMachine, StateUpdate, UpdatedState, HandoverInitiatedTray, ArmLocation, GazeTarget
+
+
+FIXTURES_DIR = os.path.dirname(os.path.realpath(__file__))
+DEFAULT_PATH = os.path.join(FIXTURES_DIR, "random_sessions_events.jsonl")
+SESSIONS = 100
+STEPS = 60
+SEED = 0
+# gaps between two events, long enough for every gaze timeout to fire in between
+MAX_GAP_SECONDS = 4.0
+START = datetime(2024, 1, 1)
+
+EVENTS = (
+    [{"handover_start_detected": tray} for tray in HandoverInitiatedTray]
+    + [{"new_arm_location": location} for location in ArmLocation]
+    + [{"new_gaze_target": target} for target in GazeTarget]
+    + [{flag: True} for flag in ("handover_finished", "object_in_bowl", "error_during_handover", "gaze_program_finished", "task_completed")]
+)
+
+
+class NullLogger:
+    def log_handover_initiation(self) -> None:
+        pass
+
+    def log_object_in_bowl(self) -> None:
+        pass
+
+    def log_handover_error(self) -> None:
+        pass
+
+
+def record_session(event_log: EventLogWriter, rng: random.Random, start: datetime, dynamic_gaze: bool, steps: int) -> datetime:
+    """Returns the time of the session's last event"""
+
+    clock = VirtualClock(start)
+    sm = StateMachine(logger=NullLogger(), dynamic_gaze=dynamic_gaze, clock=clock)
+    event_log.append("session", start, {"participant_identifier": "random", "dynamic_gaze": dynamic_gaze, "demonstration": False})
+
+    def apply(update: StateUpdate) -> None:
+        changes: UpdatedState = sm.update_state(update)
+        if changes.handover_state or changes.gaze_program or changes.arm_program:
+            event_log.append("transition", clock.now(), {"changes": changes.to_dict()})
+
+    for _ in range(steps):
+        timestamp = clock.now() + timedelta(seconds=rng.uniform(0, MAX_GAP_SECONDS))
+        # same order as SessionReplay.advance_to
+        deadline = sm.next_deadline()
+        while deadline is not None and deadline <= timestamp:
+            clock.advance_to(deadline)
+            apply(StateUpdate(state_loop_update=True))
+            next_deadline = sm.next_deadline()
+            if next_deadline == deadline:
+                break
+            deadline = next_deadline
+        clock.advance_to(timestamp)
+
+        update = StateUpdate(**rng.choice(EVENTS))
+        event_log.append("state_update", timestamp, {"update": update.to_dict()})
+        apply(update)
+    return clock.now()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record random sessions for replay.py")
+    parser.add_argument("--sessions", type=int, default=SESSIONS, help="sessions per gaze mode")
+    parser.add_argument("--steps", type=int, default=STEPS, help="events per session")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--output", default=DEFAULT_PATH)
+    args = parser.parse_args()
+
+    if os.path.exists(args.output):
+        os.remove(args.output)
+    rng = random.Random(args.seed)
+    event_log = EventLogWriter(args.output)
+    timestamp = START
+    for _ in range(args.sessions):
+        for dynamic_gaze in (True, False):
+            timestamp = record_session(event_log, rng, timestamp + timedelta(seconds=MAX_GAP_SECONDS), dynamic_gaze, args.steps)
+    event_log.close()
+    print(f"Recorded {2 * args.sessions} sessions to {args.output}")
@@ -1,12 +1,25 @@
-from datetime import datetime
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
 from enum import Enum
-from typing import Callable, Dict, List, Tuple
+from typing import Any, Dict, List, Tuple
 
+from clock import Clock
 from data_logger import DataLogger
-from util import is_time_difference_exceeded
 
 
-class GazeProgram(Enum):
+DEFAULT_POLICY_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "transitions.json")
+
+
+class IndexedEnum(Enum):
+    """Enum whose members carry their definition order, used to index the compiled transition tables"""
+
+    def __init__(self, *args):
+        self.index = len(type(self).__members__)
+
+
+class GazeProgram(IndexedEnum):
     IDLE = "idle"
     MOVE_TO_PERSON_LEFT = "move_to_person_left"
     MOVE_TO_PERSON_RIGHT = "move_to_person_right"
@@ -60,7 +73,7 @@ class ArmProgram(Enum):
     IDLE = "move_to_idle"
 
 
-class HandoverState(Enum):
+class HandoverState(IndexedEnum):
     NO_ACTIVE_HANDOVER = "no_active_handover"
     MOVING_TO_PERSON_LEFT = "moving_to_person_left"
     MOVING_TO_PERSON_RIGHT = "moving_to_person_right"
@@ -82,6 +95,21 @@ class HandoverInitiatedTray(Enum):
 
 
 class StateUpdate:
+    __slots__ = (
+        "handover_start_detected",
+        "handover_finished",
+        "object_in_bowl",
+        "error_during_handover",
+        "gaze_program_finished",
+        "new_arm_location",
+        "new_gaze_target",
+        "task_completed",
+        "state_loop_update",
+        "event_count",
+        "event_key",
+        "event_id",
+    )
+
     def __init__(
         self,
         handover_start_detected: HandoverInitiatedTray | None = None,
@@ -104,8 +132,51 @@ class StateUpdate:
         self.task_completed = task_completed
         self.state_loop_update = state_loop_update
 
+        # (attribute, value) of the event carried by this update, None if it carries zero or several events
+        self.event_count = 0
+        self.event_key = None
+        for field in UPDATE_FIELD_TYPES:
+            value = getattr(self, field)
+            if value is not None:
+                self.event_count += 1
+                self.event_key = (field, value) if self.event_count == 1 else None
+        # position of the event key in EVENT_KEYS, -1 if the update cannot be dispatched by table lookup
+        self.event_id = EVENT_IDS.get(self.event_key, -1) if self.event_key is not None else -1
+
+    def to_dict(self) -> Dict[str, str | bool]:
+        """Serializable form holding only the events that are set"""
+
+        return {
+            field: value.value if isinstance(value, Enum) else value
+            for field in UPDATE_FIELD_TYPES
+            if (value := getattr(self, field)) is not None
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, str | bool]) -> "StateUpdate":
+        return cls(**{
+            field: UPDATE_FIELD_TYPES[field](value)
+            for field, value in data.items()
+            if field in UPDATE_FIELD_TYPES
+        })
+
+
+UPDATE_FIELD_TYPES: Dict[str, type] = {
+    "handover_start_detected": HandoverInitiatedTray,
+    "handover_finished": bool,
+    "object_in_bowl": bool,
+    "error_during_handover": bool,
+    "gaze_program_finished": bool,
+    "new_arm_location": ArmLocation,
+    "new_gaze_target": GazeTarget,
+    "task_completed": bool,
+    "state_loop_update": bool,
+}
+
 
 class CurrentState:
+    __slots__ = ("current_handover_state", "current_gaze_program", "last_arm_location", "last_gaze_update")
+
     def __init__(
         self,
         current_handover_state: HandoverState,
@@ -120,6 +191,8 @@ class CurrentState:
 
 
 class UpdatedState:
+    __slots__ = ("gaze_program", "arm_program", "handover_state")
+
     def __init__(
         self,
         gaze_program: GazeProgram | None = None,
@@ -130,886 +203,304 @@ class UpdatedState:
         self.arm_program = arm_program
         self.handover_state = handover_state
 
+    def to_dict(self) -> Dict[str, str]:
+        return {
+            field: value.value
+            for field in UpdatedState.__slots__
+            if (value := getattr(self, field)) is not None
+        }
+
+
+EventKey = Tuple[str, object]
+
+# every (StateUpdate attribute, value) pair an update can carry, used to index the transition tables
+EVENT_KEYS: List[EventKey] = (
+    [("handover_start_detected", tray) for tray in HandoverInitiatedTray]
+    + [("new_arm_location", location) for location in ArmLocation]
+    + [("new_gaze_target", target) for target in GazeTarget]
+    + [
+        (flag, True)
+        for flag in (
+            "handover_finished",
+            "object_in_bowl",
+            "error_during_handover",
+            "gaze_program_finished",
+            "task_completed",
+            "state_loop_update",
+        )
+    ]
+)
+
+EVENT_IDS: Dict[EventKey, int] = {key: event_id for event_id, key in enumerate(EVENT_KEYS)}
 
-HandoverTransition = Tuple[
-    Callable[[StateUpdate, CurrentState], bool],
-    HandoverState,
-    ArmProgram | None,
-    GazeProgram | None,
-]
-GazeTransition = Tuple[
-    Callable[[StateUpdate, CurrentState], bool], GazeProgram
-]
+# shared empty lookup, so a miss in update_state does not allocate
+NO_TRANSITIONS: tuple = ()
+
+MOVING_TO_PERSON_STATES = frozenset((HandoverState.MOVING_TO_PERSON_LEFT, HandoverState.MOVING_TO_PERSON_RIGHT))
+MOVING_TO_PACKAGING_STATES = frozenset((HandoverState.MOVING_TO_PACKAGING_LEFT, HandoverState.MOVING_TO_PACKAGING_RIGHT))
+ERROR_STATES = frozenset((HandoverState.ERROR_LEFT, HandoverState.ERROR_RIGHT))
+
+
+class HandoverRule:
+    """Handover transition taken when the update carries the event `field` = `value`"""
+
+    __slots__ = ("field", "value", "dst", "arm_program", "gaze_program")
+
+    def __init__(self, field: str, value: object, dst: HandoverState, arm_program: ArmProgram | None, gaze_program: GazeProgram | None):
+        self.field = field
+        self.value = value
+        self.dst = dst
+        self.arm_program = arm_program
+        self.gaze_program = gaze_program
+
+    def matches(self, u: StateUpdate) -> bool:
+        return getattr(u, self.field) == self.value
+
+
+class GazeRule:
+    """Dynamic gaze transition taken on the event `field` = `value`, or once the gaze program has been active for `timeout` seconds"""
+
+    __slots__ = ("field", "value", "timeout", "dst")
+
+    def __init__(self, field: str | None, value: object, timeout: float | None, dst: GazeProgram):
+        self.field = field
+        self.value = value
+        self.timeout = timeout
+        self.dst = dst
+
+    def matches(self, u: StateUpdate) -> bool:
+        return self.field is not None and getattr(u, self.field) == self.value
+
+
+class TransitionPolicy:
+    """Transition spec compiled into tables indexed by HandoverState.index, GazeProgram.index and StateUpdate.event_id.
+
+    A table cell holds the rules that can fire for that event in their spec order; timeout rules are
+    part of every cell of their gaze program, as they can fire on any update once they are due.
+    """
+
+    def __init__(self, spec: Dict[str, Any], source: str = "<spec>"):
+        self.source = source
+        self.digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+        events = len(EVENT_KEYS)
+
+        # [handover state][event id] and [handover state] for updates carrying several events
+        self.handover_table: List[List[Tuple[HandoverRule, ...]]] = [[NO_TRANSITIONS] * events for _ in HandoverState]
+        self.handover_rules: List[Tuple[HandoverRule, ...]] = [NO_TRANSITIONS for _ in HandoverState]
+        # [handover state] -> gaze program of static gaze
+        self.static_gaze: List[GazeProgram] = [GazeProgram.IDLE for _ in HandoverState]
+        # [handover state][gaze program][event id] and [handover state][gaze program]
+        self.gaze_table: List[List[List[Tuple[GazeRule, ...]]]] = [
+            [[NO_TRANSITIONS] * events for _ in GazeProgram] for _ in HandoverState
+        ]
+        self.gaze_rules: List[List[Tuple[GazeRule, ...]]] = [[NO_TRANSITIONS for _ in GazeProgram] for _ in HandoverState]
+        # [handover state][gaze program] -> shortest timeout, a timeout rule can only fire once it has passed
+        self.gaze_timeouts: List[List[float | None]] = [[None for _ in GazeProgram] for _ in HandoverState]
+
+        self.__compile(spec)
+
+    def __compile(self, spec: Dict[str, Any]) -> None:
+        unknown = set(spec) - {"handover", "static_gaze", "dynamic_gaze"}
+        if unknown:
+            raise ValueError(f"{self.source}: unknown sections {sorted(unknown)}")
+
+        handover: Dict[HandoverState, List[Tuple[int, HandoverRule]]] = {}
+        for position, entry in enumerate(spec.get("handover", [])):
+            where = f"{self.source}: handover[{position}]"
+            self.__check_keys(where, entry, {"from", "on", "to"}, {"arm_program", "gaze_program"})
+            field, value, event_id = self.__event(where, entry["on"])
+            rule = HandoverRule(
+                field,
+                value,
+                self.__enum(where, HandoverState, entry["to"]),
+                self.__enum(where, ArmProgram, entry["arm_program"]) if "arm_program" in entry else None,
+                self.__enum(where, GazeProgram, entry["gaze_program"]) if "gaze_program" in entry else None,
+            )
+            handover.setdefault(self.__enum(where, HandoverState, entry["from"]), []).append((event_id, rule))
+
+        for hs, rules in handover.items():
+            self.handover_rules[hs.index] = tuple(rule for _, rule in rules)
+            for event_id in range(len(EVENT_KEYS)):
+                self.handover_table[hs.index][event_id] = tuple(rule for rule_event, rule in rules if rule_event == event_id)
+
+        static_gaze = spec.get("static_gaze", {})
+        for hs in HandoverState:
+            if hs.value not in static_gaze:
+                raise ValueError(f"{self.source}: static_gaze has no gaze program for {hs.value}")
+            self.static_gaze[hs.index] = self.__enum(f"{self.source}: static_gaze", GazeProgram, static_gaze[hs.value])
+        for state in set(static_gaze) - {hs.value for hs in HandoverState}:
+            raise ValueError(f"{self.source}: static_gaze: unknown handover state '{state}'")
+
+        gaze: Dict[Tuple[HandoverState, GazeProgram], List[Tuple[int | None, GazeRule]]] = {}
+        for position, entry in enumerate(spec.get("dynamic_gaze", [])):
+            where = f"{self.source}: dynamic_gaze[{position}]"
+            self.__check_keys(where, entry, {"state", "from", "to"}, {"on", "after"})
+            if ("on" in entry) == ("after" in entry):
+                raise ValueError(f"{where}: needs exactly one of 'on' and 'after'")
+            dst = self.__enum(where, GazeProgram, entry["to"])
+            if "on" in entry:
+                field, value, event_id = self.__event(where, entry["on"])
+                rule = GazeRule(field, value, None, dst)
+            else:
+                timeout = entry["after"]
+                if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout < 0:
+                    raise ValueError(f"{where}: 'after' must be a non-negative number of seconds")
+                event_id, rule = None, GazeRule(None, None, float(timeout), dst)
+            key = (self.__enum(where, HandoverState, entry["state"]), self.__enum(where, GazeProgram, entry["from"]))
+            gaze.setdefault(key, []).append((event_id, rule))
+
+        for (hs, gp), rules in gaze.items():
+            self.gaze_rules[hs.index][gp.index] = tuple(rule for _, rule in rules)
+            for event_id in range(len(EVENT_KEYS)):
+                self.gaze_table[hs.index][gp.index][event_id] = tuple(
+                    rule for rule_event, rule in rules if rule_event is None or rule_event == event_id
+                )
+            timeouts = [rule.timeout for _, rule in rules if rule.timeout is not None]
+            if timeouts:
+                self.gaze_timeouts[hs.index][gp.index] = min(timeouts)
+
+    @staticmethod
+    def __check_keys(where: str, entry: Any, required: set, optional: set) -> None:
+        if not isinstance(entry, dict):
+            raise ValueError(f"{where}: expected an object")
+        missing = required - set(entry)
+        if missing:
+            raise ValueError(f"{where}: missing {sorted(missing)}")
+        unknown = set(entry) - required - optional
+        if unknown:
+            raise ValueError(f"{where}: unknown keys {sorted(unknown)}")
+
+    @staticmethod
+    def __enum(where: str, enum: type, value: Any) -> Enum:
+        try:
+            return enum(value)
+        except ValueError:
+            raise ValueError(f"{where}: unknown {enum.__name__} '{value}'") from None
+
+    @classmethod
+    def __event(cls, where: str, on: Any) -> Tuple[str, object, int]:
+        if not isinstance(on, dict) or len(on) != 1:
+            raise ValueError(f"{where}: 'on' must name exactly one event")
+        (field, raw), = on.items()
+        if field not in UPDATE_FIELD_TYPES:
+            raise ValueError(f"{where}: unknown event '{field}'")
+        field_type = UPDATE_FIELD_TYPES[field]
+        value = raw if field_type is bool else cls.__enum(where, field_type, raw)
+        if (field, value) not in EVENT_IDS:
+            raise ValueError(f"{where}: {field} can never be {raw!r}")
+        return field, value, EVENT_IDS[(field, value)]
+
+
+# compiled policies by path and spec content, so constructing a StateMachine does not recompile
+POLICY_CACHE: Dict[Tuple[str, str], TransitionPolicy] = {}
+
+
+def load_policy(path: str = DEFAULT_POLICY_PATH) -> TransitionPolicy:
+    """Loads, validates and compiles a transition spec, raises ValueError if it is invalid"""
+
+    path = os.path.realpath(path)
+    with open(path, "rb") as file:
+        content = file.read()
+    key = (path, hashlib.sha256(content).hexdigest())
+    if key not in POLICY_CACHE:
+        try:
+            spec = json.loads(content)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{path}: {e}") from None
+        if not isinstance(spec, dict):
+            raise ValueError(f"{path}: expected an object")
+        POLICY_CACHE[key] = TransitionPolicy(spec, source=path)
+    return POLICY_CACHE[key]
 
 
 class StateMachine:
-    def __init__(self, logger: DataLogger, dynamic_gaze: bool):
+    def __init__(self, logger: DataLogger, dynamic_gaze: bool, clock: Clock | None = None, policy: TransitionPolicy | None = None):
         self.logger = logger
         self.dynamic_gaze = dynamic_gaze
+        self.clock = clock or Clock()
+        self.policy = policy or load_policy()
+        self.guard_evaluations = 0
 
         self.state = CurrentState(
             current_handover_state=HandoverState.NO_ACTIVE_HANDOVER,
             current_gaze_program=GazeProgram.IDLE,
             last_arm_location=ArmLocation.IDLE,
-            last_gaze_update=datetime.now(),
+            last_gaze_update=self.clock.now(),
         )
 
-        self.handover_state_transitions: Dict[HandoverState, List[HandoverTransition]] = {
-            HandoverState.NO_ACTIVE_HANDOVER: [
-                (
-                    lambda u, c: u.handover_start_detected == HandoverInitiatedTray.LEFT,
-                    HandoverState.MOVING_TO_PERSON_LEFT,
-                    ArmProgram.MOVE_TO_LEFT_HANDOVER,
-                    GazeProgram.MOVE_TO_PERSON_LEFT,
-                ),
-                (
-                    lambda u, c: u.handover_start_detected == HandoverInitiatedTray.RIGHT,
-                    HandoverState.MOVING_TO_PERSON_RIGHT,
-                    ArmProgram.MOVE_TO_RIGHT_HANDOVER,
-                    GazeProgram.MOVE_TO_PERSON_RIGHT,
-                )
-            ],
-            HandoverState.MOVING_TO_PERSON_LEFT: [
-                (
-                    lambda u, c: u.new_arm_location == ArmLocation.HANDOVER_LOCATION,
-                    HandoverState.WAITING_FOR_RECEIVAL_LEFT,
-                    None,
-                    GazeProgram.RECEIVING_LEFT,
-                )
-            ],
-            HandoverState.MOVING_TO_PERSON_RIGHT: [
-                (
-                    lambda u, c: u.new_arm_location == ArmLocation.HANDOVER_LOCATION,
-                    HandoverState.WAITING_FOR_RECEIVAL_RIGHT,
-                    None,
-                    GazeProgram.RECEIVING_RIGHT,
-                )
-            ],
-            HandoverState.WAITING_FOR_RECEIVAL_LEFT: [
-                (
-                    lambda u, c: u.object_in_bowl == True,
-                    HandoverState.MOVING_TO_PACKAGING_LEFT,
-                    ArmProgram.MOVE_TO_PACKAGING,
-                    GazeProgram.MOVE_TO_PACKAGING_LEFT,
-                ),
-                    (
-                    lambda u, c: u.error_during_handover == True,
-                    HandoverState.ERROR_LEFT,
-                    ArmProgram.MOVE_TO_ERROR_POSE,
-                    GazeProgram.MOVE_TO_ERROR_LEFT,
-                )
-            ],
-            HandoverState.WAITING_FOR_RECEIVAL_RIGHT: [
-                (
-                    lambda u, c: u.object_in_bowl == True,
-                    HandoverState.MOVING_TO_PACKAGING_RIGHT,
-                    ArmProgram.MOVE_TO_PACKAGING,
-                    GazeProgram.MOVE_TO_PACKAGING_RIGHT,
-                ),
-                (
-                    lambda u, c: u.error_during_handover == True,
-                    HandoverState.ERROR_RIGHT,
-                    ArmProgram.MOVE_TO_ERROR_POSE,
-                    GazeProgram.MOVE_TO_ERROR_RIGHT,
-                )
-            ],
-            HandoverState.ERROR_LEFT: [
-                (
-                    lambda u, c: u.new_arm_location == ArmLocation.ERROR_POSE,
-                    HandoverState.ERROR_WAITING_LEFT,
-                    None,
-                    GazeProgram.UNSURE,
-                )
-            ],
-            HandoverState.ERROR_RIGHT: [
-                (
-                    lambda u, c: u.new_arm_location == ArmLocation.ERROR_POSE,
-                    HandoverState.ERROR_WAITING_RIGHT,
-                    None,
-                    GazeProgram.UNSURE,
-                )
-            ],
-            HandoverState.ERROR_WAITING_LEFT: [
-                (
-                    lambda u, c: u.handover_start_detected == HandoverInitiatedTray.LEFT,
-                    HandoverState.MOVING_TO_PERSON_LEFT,
-                    ArmProgram.MOVE_TO_LEFT_HANDOVER,
-                    GazeProgram.ERROR_TO_PERSON_LEFT,
-                ),
-                (
-                    lambda u, c: u.handover_start_detected == HandoverInitiatedTray.RIGHT,
-                    HandoverState.MOVING_TO_PERSON_RIGHT,
-                    ArmProgram.MOVE_TO_RIGHT_HANDOVER,
-                    GazeProgram.ERROR_TO_PERSON_RIGHT,
-                )
-            ],
-            HandoverState.ERROR_WAITING_RIGHT: [
-                (
-                    lambda u, c: u.handover_start_detected == HandoverInitiatedTray.LEFT,
-                    HandoverState.MOVING_TO_PERSON_LEFT,
-                    ArmProgram.MOVE_TO_LEFT_HANDOVER,
-                    GazeProgram.ERROR_TO_PERSON_LEFT,
-                ),
-                (
-                    lambda u, c: u.handover_start_detected == HandoverInitiatedTray.RIGHT,
-                    HandoverState.MOVING_TO_PERSON_RIGHT,
-                    ArmProgram.MOVE_TO_RIGHT_HANDOVER,
-                    GazeProgram.ERROR_TO_PERSON_RIGHT,
-                )
-            ],
-            HandoverState.MOVING_TO_PACKAGING_LEFT: [
-                (
-                    lambda u, c: u.new_arm_location == ArmLocation.PACKAGING,
-                    HandoverState.PACKAGING,
-                    None,
-                    GazeProgram.PACKAGING,
-                )
-            ],
-            HandoverState.MOVING_TO_PACKAGING_RIGHT: [
-                (
-                    lambda u, c: u.new_arm_location == ArmLocation.PACKAGING,
-                    HandoverState.PACKAGING,
-                    None,
-                    GazeProgram.PACKAGING,
-                )
-            ],
-            HandoverState.PACKAGING: [
-                (
-                    lambda u, c: u.handover_finished == True,
-                    HandoverState.NO_ACTIVE_HANDOVER,
-                    None,
-                    GazeProgram.MUTUAL,
-                ),
-                (
-                    lambda u, c: u.task_completed == True,
-                    HandoverState.TASK_COMPLETED,
-                    ArmProgram.IDLE,
-                    GazeProgram.MUTUAL,
-                )
-            ]
-        }
-
-        self.dynamic_gaze_transitions: Dict[HandoverState, Dict[GazeProgram, List[GazeTransition]]] = {
-            HandoverState.NO_ACTIVE_HANDOVER: {
-                GazeProgram.MUTUAL: [
-                    (
-                        lambda u, c: (datetime.now()-c.last_gaze_update).total_seconds() >= 3,
-                        GazeProgram.UNSURE,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.LEFT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.RIGHT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.PACKAGING_AREA,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ],
-                GazeProgram.UNSURE: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.MUTUAL,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.LEFT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.RIGHT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.PACKAGING_AREA,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ],
-                GazeProgram.LEFT_HANDOVER: [
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.ROBOT_FACE,
-                        GazeProgram.MUTUAL,
-                    ),
-                    (
-                        lambda u, c: (datetime.now()-c.last_gaze_update).total_seconds() >= 4,
-                        GazeProgram.IDLE,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.RIGHT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.PACKAGING_AREA,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ],
-                GazeProgram.RIGHT_HANDOVER: [
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.ROBOT_FACE,
-                        GazeProgram.MUTUAL,
-                    ),
-                    (
-                        lambda u, c: (datetime.now()-c.last_gaze_update).total_seconds() >= 4,
-                        GazeProgram.IDLE,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.LEFT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.PACKAGING_AREA,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ],
-                GazeProgram.IDLE: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.IDLE,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.ROBOT_FACE,
-                        GazeProgram.MUTUAL,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.LEFT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.RIGHT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.PACKAGING_AREA,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ],
-                GazeProgram.PACKAGING_STATIC: [
-                    (
-                        lambda u, c: (datetime.now()-c.last_gaze_update).total_seconds() >= 4,
-                        GazeProgram.IDLE,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.LEFT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.RIGHT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.PACKAGING_AREA,
-                        GazeProgram.PACKAGING_STATIC,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.ROBOT_FACE,
-                        GazeProgram.MUTUAL,
-                    )
-                ]
-            },
-            HandoverState.MOVING_TO_PERSON_LEFT: {
-                GazeProgram.MOVE_TO_PERSON_LEFT: [
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.EMPHASIZE_LEFT,
-                    )
-                ]
-            },
-            HandoverState.MOVING_TO_PERSON_RIGHT: {
-                GazeProgram.MOVE_TO_PERSON_RIGHT: [
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.EMPHASIZE_RIGHT,
-                    )
-                ]
-            },
-            HandoverState.WAITING_FOR_RECEIVAL_LEFT: {
-                GazeProgram.RECEIVING_LEFT: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.MUTUAL,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.PACKAGING_AREA,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ],
-                GazeProgram.MUTUAL: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.ENSURING_LEFT,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.ENSURING_LEFT,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.PACKAGING_AREA,
-                        GazeProgram.PACKAGING_STATIC,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.LEFT_HANDOVER,
-                    )
-                ],
-                GazeProgram.ENSURING_LEFT: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.RECEIVING_LEFT,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.PACKAGING_AREA,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ],
-                GazeProgram.PACKAGING_STATIC: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.MUTUAL_SHORT,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.LEFT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.ENSURING_LEFT,
-                    )
-                ],
-                GazeProgram.MUTUAL_SHORT: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.RECEIVING_LEFT,
-                    )
-                ],
-                GazeProgram.LEFT_HANDOVER: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.ENSURING_LEFT,
-                    )
-                ]
-            },
-            HandoverState.WAITING_FOR_RECEIVAL_RIGHT: {
-                GazeProgram.RECEIVING_RIGHT: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.MUTUAL,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.PACKAGING_AREA,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ],
-                GazeProgram.MUTUAL: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.ENSURING_RIGHT,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.ENSURING_RIGHT,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.PACKAGING_AREA,
-                        GazeProgram.PACKAGING_STATIC,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.RIGHT_HANDOVER,
-                    )
-                ],
-                GazeProgram.ENSURING_RIGHT: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.RECEIVING_RIGHT,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.PACKAGING_AREA,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ],
-                GazeProgram.PACKAGING_STATIC: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.MUTUAL_SHORT,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.RIGHT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.ENSURING_RIGHT,
-                    )
-                ],
-                GazeProgram.MUTUAL_SHORT: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.RECEIVING_RIGHT,
-                    )
-                ],
-                GazeProgram.RIGHT_HANDOVER: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.ENSURING_RIGHT,
-                    )
-                ]
-            },
-            HandoverState.ERROR_LEFT: {
-                GazeProgram.MOVE_TO_ERROR_LEFT: [
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.ROBOT_FACE,
-                        GazeProgram.MUTUAL_SHORT,
-                    ),
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.ERROR_POSE,
-                    )
-                ],
-                GazeProgram.MUTUAL_SHORT: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.ERROR_POSE,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.LEFT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.RIGHT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.PACKAGING_AREA,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ],
-                GazeProgram.ERROR_POSE: [
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.LEFT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.RIGHT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.PACKAGING_AREA,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ],
-                GazeProgram.LEFT_HANDOVER: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.ERROR_POSE,
-                    )
-                ],
-                GazeProgram.RIGHT_HANDOVER: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.ERROR_POSE,
-                    )
-                ],
-                GazeProgram.PACKAGING_STATIC: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.ERROR_POSE,
-                    )
-                ]
-            },
-            HandoverState.ERROR_RIGHT: {
-                GazeProgram.MOVE_TO_ERROR_RIGHT: [
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.ROBOT_FACE,
-                        GazeProgram.MUTUAL_SHORT,
-                    ),
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.ERROR_POSE,
-                    )
-                ],
-                GazeProgram.MUTUAL_SHORT: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.ERROR_POSE,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.LEFT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.RIGHT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.PACKAGING_AREA,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ],
-                GazeProgram.ERROR_POSE: [
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.LEFT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.RIGHT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.PACKAGING_AREA,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ],
-                GazeProgram.LEFT_HANDOVER: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.ERROR_POSE,
-                    )
-                ],
-                GazeProgram.RIGHT_HANDOVER: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.ERROR_POSE,
-                    )
-                ],
-                GazeProgram.PACKAGING_STATIC: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.ERROR_POSE,
-                    )
-                ]
-            },
-            HandoverState.ERROR_WAITING_LEFT: {
-                GazeProgram.MUTUAL: [
-                    (
-                        lambda u, c: (datetime.now()-c.last_gaze_update).total_seconds() >= 3,
-                        GazeProgram.UNSURE,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.LEFT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.RIGHT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.PACKAGING_AREA,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ],
-                GazeProgram.UNSURE: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.PACKAGING_STATIC,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.LEFT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.RIGHT_HANDOVER,
-                    )
-                ],
-                GazeProgram.LEFT_HANDOVER: [
-                    (
-                        lambda u, c: (datetime.now()-c.last_gaze_update).total_seconds() >= 2,
-                        GazeProgram.MUTUAL,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.RIGHT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.PACKAGING_AREA,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ],
-                GazeProgram.RIGHT_HANDOVER: [
-                    (
-                        lambda u, c: (datetime.now()-c.last_gaze_update).total_seconds() >= 2,
-                        GazeProgram.LEFT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.LEFT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.PACKAGING_AREA,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ],
-                GazeProgram.PACKAGING_STATIC: [
-                    (
-                        lambda u, c: (datetime.now()-c.last_gaze_update).total_seconds() >= 2,
-                        GazeProgram.RIGHT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.LEFT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.RIGHT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.PACKAGING_AREA,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ]
-            },
-            HandoverState.ERROR_WAITING_RIGHT: {
-                GazeProgram.MUTUAL: [
-                    (
-                        lambda u, c: (datetime.now()-c.last_gaze_update).total_seconds() >= 3,
-                        GazeProgram.UNSURE,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.LEFT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.RIGHT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.PACKAGING_AREA,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ],
-                GazeProgram.UNSURE: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.PACKAGING_STATIC,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.LEFT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.RIGHT_HANDOVER,
-                    )
-                ],
-                GazeProgram.LEFT_HANDOVER: [
-                    (
-                        lambda u, c: (datetime.now()-c.last_gaze_update).total_seconds() >= 2,
-                        GazeProgram.MUTUAL,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.RIGHT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.PACKAGING_AREA,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ],
-                GazeProgram.RIGHT_HANDOVER: [
-                    (
-                        lambda u, c: (datetime.now()-c.last_gaze_update).total_seconds() >= 2,
-                        GazeProgram.LEFT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.LEFT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.PACKAGING_AREA,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ],
-                GazeProgram.PACKAGING_STATIC: [
-                    (
-                        lambda u, c: (datetime.now()-c.last_gaze_update).total_seconds() >= 2,
-                        GazeProgram.RIGHT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.LEFT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.RIGHT_HANDOVER,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.PACKAGING_AREA,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ]
-            },
-            HandoverState.MOVING_TO_PACKAGING_LEFT: {
-                GazeProgram.MOVE_TO_PACKAGING_LEFT: [
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.ROBOT_FACE,
-                        GazeProgram.MUTUAL_SHORT,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.PACKAGING_ACKNOWLEDGE_LEFT,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.PACKAGING_ACKNOWLEDGE_RIGHT,
-                    )
-                ],
-                GazeProgram.MUTUAL_SHORT: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.PACKAGING_STATIC,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.PACKAGING_ACKNOWLEDGE_LEFT,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.PACKAGING_ACKNOWLEDGE_RIGHT,
-                    )
-                ],
-                GazeProgram.PACKAGING_ACKNOWLEDGE_LEFT: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ],
-                GazeProgram.PACKAGING_ACKNOWLEDGE_RIGHT: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ]
-            },
-            HandoverState.MOVING_TO_PACKAGING_RIGHT: {
-                GazeProgram.MOVE_TO_PACKAGING_RIGHT: [
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.ROBOT_FACE,
-                        GazeProgram.MUTUAL_SHORT,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.PACKAGING_ACKNOWLEDGE_LEFT,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.PACKAGING_ACKNOWLEDGE_RIGHT,
-                    )
-                ],
-                GazeProgram.MUTUAL_SHORT: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.PACKAGING_STATIC,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.LEFT_HANDOVER_LOCATION,
-                        GazeProgram.PACKAGING_ACKNOWLEDGE_LEFT,
-                    ),
-                    (
-                        lambda u, c: u.new_gaze_target == GazeTarget.RIGHT_HANDOVER_LOCATION,
-                        GazeProgram.PACKAGING_ACKNOWLEDGE_RIGHT,
-                    )
-                ],
-                GazeProgram.PACKAGING_ACKNOWLEDGE_LEFT: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ],
-                GazeProgram.PACKAGING_ACKNOWLEDGE_RIGHT: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ]
-            },
-            HandoverState.PACKAGING: {
-                GazeProgram.PACKAGING: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.PACKAGING_STATIC,
-                    )
-                ]
-            },
-            HandoverState.TASK_COMPLETED: {
-                GazeProgram.MUTUAL: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.IDLE,
-                    )
-                ],
-                GazeProgram.IDLE: [
-                    (
-                        lambda u, c: u.gaze_program_finished == True,
-                        GazeProgram.IDLE,
-                    )
-                ]
-            }
-        }
+    def next_deadline(self) -> datetime | None:
+        """Returns the time at which the next timeout transition becomes due, None if there is none"""
 
-        # static gaze simply maps handover states to gaze program
-        self.static_gaze_map = {
-            HandoverState.NO_ACTIVE_HANDOVER: GazeProgram.MUTUAL,
-            HandoverState.MOVING_TO_PERSON_LEFT: GazeProgram.MOVE_TO_PERSON_LEFT,
-            HandoverState.MOVING_TO_PERSON_RIGHT: GazeProgram.MOVE_TO_PERSON_RIGHT,
-            HandoverState.WAITING_FOR_RECEIVAL_LEFT: GazeProgram.RECEIVING_LEFT,
-            HandoverState.WAITING_FOR_RECEIVAL_RIGHT: GazeProgram.RECEIVING_RIGHT,
-            HandoverState.ERROR_LEFT: GazeProgram.MOVE_TO_ERROR_LEFT,
-            HandoverState.ERROR_RIGHT: GazeProgram.MOVE_TO_ERROR_RIGHT,
-            HandoverState.ERROR_WAITING_LEFT: GazeProgram.UNSURE,
-            HandoverState.ERROR_WAITING_RIGHT: GazeProgram.UNSURE,
-            HandoverState.MOVING_TO_PACKAGING_LEFT: GazeProgram.MOVE_TO_PACKAGING_LEFT,
-            HandoverState.MOVING_TO_PACKAGING_RIGHT: GazeProgram.MOVE_TO_PACKAGING_RIGHT,
-            HandoverState.PACKAGING: GazeProgram.PACKAGING,
-            HandoverState.TASK_COMPLETED: GazeProgram.IDLE,
-        }
+        if not self.dynamic_gaze:
+            return None
+        timeout = self.policy.gaze_timeouts[self.state.current_handover_state.index][self.state.current_gaze_program.index]
+        if timeout is None:
+            return None
+        return self.state.last_gaze_update + timedelta(seconds=timeout)
 
     def update_state(self, u: StateUpdate) -> UpdatedState:
         changes = UpdatedState()
-
-        if not any([
-            u.new_gaze_target,
-            u.gaze_program_finished,
-            u.state_loop_update
-        ]):
-            for guard, dst_hs, new_arm, new_gaze in self.handover_state_transitions.get(self.state.current_handover_state, []):
-                if guard(u, self.state):
-                    self.state.current_handover_state = dst_hs
-                    changes.handover_state = dst_hs
-                    if new_arm is not None:
-                        changes.arm_program = new_arm
-                    if new_gaze is not None:
-                        self.state.current_gaze_program = new_gaze
-                        changes.gaze_program = new_gaze
+        policy = self.policy
+        state = self.state
+
+        event_id = u.event_id
+        # rules evaluated by the last update, exposed as a metric
+        self.guard_evaluations = 0
+
+        gaze_event = u.new_gaze_target or u.gaze_program_finished or u.state_loop_update
+
+        if not gaze_event:
+            hs = state.current_handover_state
+            if event_id >= 0:
+                candidates = policy.handover_table[hs.index][event_id]
+            else:
+                # updates carrying several events are matched against the rules of the state in spec order
+                candidates = policy.handover_rules[hs.index] if u.event_count else NO_TRANSITIONS
+
+            for rule in candidates:
+                self.guard_evaluations += 1
+                if event_id >= 0 or rule.matches(u):
+                    state.current_handover_state = rule.dst
+                    changes.handover_state = rule.dst
+                    if rule.arm_program is not None:
+                        changes.arm_program = rule.arm_program
+                    if rule.gaze_program is not None:
+                        state.current_gaze_program = rule.gaze_program
+                        changes.gaze_program = rule.gaze_program
                     break
 
             if u.new_arm_location:
-                self.state.last_arm_location = u.new_arm_location
-            
-        if u.handover_start_detected and changes.handover_state in [HandoverState.MOVING_TO_PERSON_LEFT, HandoverState.MOVING_TO_PERSON_RIGHT]:
+                state.last_arm_location = u.new_arm_location
+
+        if u.handover_start_detected and changes.handover_state in MOVING_TO_PERSON_STATES:
             self.logger.log_handover_initiation()
-        elif u.object_in_bowl and changes.handover_state in [HandoverState.MOVING_TO_PACKAGING_LEFT, HandoverState.MOVING_TO_PACKAGING_RIGHT]:
+        elif u.object_in_bowl and changes.handover_state in MOVING_TO_PACKAGING_STATES:
             self.logger.log_object_in_bowl()
-        elif u.error_during_handover and changes.handover_state in [HandoverState.ERROR_LEFT, HandoverState.ERROR_RIGHT]:
+        elif u.error_during_handover and changes.handover_state in ERROR_STATES:
             self.logger.log_handover_error()
 
         if not self.dynamic_gaze and changes.handover_state:
-            self.state.current_gaze_program = self.static_gaze_map[
-                changes.handover_state
-            ]
-            changes.gaze_program = self.state.current_gaze_program
+            state.current_gaze_program = policy.static_gaze[changes.handover_state.index]
+            changes.gaze_program = state.current_gaze_program
             return changes
 
-        if (
-            self.dynamic_gaze
-            and any([u.new_gaze_target, u.gaze_program_finished, u.state_loop_update])
-        ):
-            for guard, next_gp in self.dynamic_gaze_transitions.get(self.state.current_handover_state, {}).get(self.state.current_gaze_program, []):
-                if guard(u, self.state):
-                    self.state.current_gaze_program = next_gp
-                    changes.gaze_program = next_gp
-                    self.state.last_gaze_update = datetime.now()
+        if self.dynamic_gaze and gaze_event:
+            hs, gp = state.current_handover_state, state.current_gaze_program
+            if event_id >= 0:
+                candidates = policy.gaze_table[hs.index][gp.index][event_id]
+            else:
+                candidates = policy.gaze_rules[hs.index][gp.index]
+
+            for rule in candidates:
+                self.guard_evaluations += 1
+                if rule.timeout is not None:
+                    fired = (self.clock.now() - state.last_gaze_update).total_seconds() >= rule.timeout
+                else:
+                    fired = event_id >= 0 or rule.matches(u)
+                if fired:
+                    state.current_gaze_program = rule.dst
+                    changes.gaze_program = rule.dst
+                    state.last_gaze_update = self.clock.now()
                     break
 
         return changes
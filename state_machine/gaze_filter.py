@@ -0,0 +1,128 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Callable
+
+from fsm import GazeTarget
+from metrics import GAZE_TARGETS_COLLAPSED, GAZE_TARGETS_STALE
+
+
+COALESCE_WINDOW_MS = 50
+HYSTERESIS_MS = 200
+# a sequence number this far below the last accepted one is taken as a restarted sender, not a stale message
+SEQUENCE_RESTART_GAP = 1000
+# senders whose last sequence number is remembered, the least recently active one is forgotten first
+MAX_SENDERS = 64
+
+
+class GazeTargetFilter:
+    """Ingestion stage between incoming gaze targets and the state machine.
+
+    Targets arriving within `window_ms` of the first target of a burst are coalesced into the last one.
+    A coalesced target replaces the forwarded target only if the forwarded one has been held for at
+    least `hysteresis_ms`, otherwise it waits until then and may still be superseded; a participant
+    whose gaze flips between two regions and back therefore causes no transition at all.
+    Targets carrying a sequence number not above the last accepted one of the same sender are dropped as
+    stale; a restarted tracker sends under a new sender id and starts over.
+    """
+
+    def __init__(
+        self,
+        on_target: Callable[[GazeTarget, float], None],
+        window_ms: float = COALESCE_WINDOW_MS,
+        hysteresis_ms: float = HYSTERESIS_MS,
+        session_id: str = "default",
+    ):
+        self.on_target = on_target
+        self.session_id = session_id
+        self.window = window_ms / 1000
+        self.hysteresis = hysteresis_ms / 1000
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.timer: asyncio.TimerHandle | None = None
+
+        self.pending: GazeTarget | None = None
+        # time.perf_counter() at which the pending target was received, handed on with it
+        self.pending_received_at: float | None = None
+        self.forwarded: GazeTarget | None = None
+        self.forwarded_at: float | None = None
+        self.last_seq: OrderedDict[str | None, int] = OrderedDict()
+
+        self.received = 0
+        self.forwarded_count = 0
+        self.collapsed = 0
+        self.stale = 0
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+
+    def stop(self) -> None:
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+
+    def offer(self, target: GazeTarget, seq: int | None = None, sender: str | None = None, received_at: float | None = None) -> bool:
+        """Must be called on the event loop after start(), returns False if the target was dropped as stale.
+
+        `received_at` is the time.perf_counter() at which the request carrying the target arrived.
+        """
+
+        self.received += 1
+        if seq is not None:
+            last_seq = self.last_seq.get(sender)
+            if last_seq is not None and last_seq - SEQUENCE_RESTART_GAP < seq <= last_seq:
+                self.stale += 1
+                GAZE_TARGETS_STALE.inc(self.session_id)
+                return False
+            self.last_seq[sender] = seq
+            self.last_seq.move_to_end(sender)
+            if len(self.last_seq) > MAX_SENDERS:
+                self.last_seq.popitem(last=False)
+
+        if self.pending is not None:
+            # superseded before it reached the state machine
+            self.__collapse()
+        self.pending = target
+        self.pending_received_at = received_at or time.perf_counter()
+        if self.timer is None:
+            self.__schedule(self.window)
+        return True
+
+    def summary(self) -> dict:
+        return {
+            "received": self.received,
+            "forwarded": self.forwarded_count,
+            "collapsed": self.collapsed,
+            "stale": self.stale,
+        }
+
+    def __collapse(self) -> None:
+        self.collapsed += 1
+        GAZE_TARGETS_COLLAPSED.inc(self.session_id)
+
+    def __schedule(self, delay: float) -> None:
+        if delay > 0:
+            self.timer = self.loop.call_later(delay, self.__flush)
+        else:
+            self.__flush()
+
+    def __flush(self) -> None:
+        self.timer = None
+        if self.pending is None:
+            return
+
+        if self.pending == self.forwarded:
+            # the gaze returned to the forwarded target, nothing changed for the state machine
+            self.__collapse()
+            self.pending = None
+            return
+
+        now = self.loop.time()
+        if self.forwarded_at is not None and now - self.forwarded_at < self.hysteresis:
+            self.__schedule(self.forwarded_at + self.hysteresis - now)
+            return
+
+        target, self.pending = self.pending, None
+        self.forwarded = target
+        self.forwarded_at = now
+        self.forwarded_count += 1
+        self.on_target(target, self.pending_received_at)
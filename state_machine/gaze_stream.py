@@ -0,0 +1,74 @@
+import json
+import time
+from collections import deque
+from typing import Deque, Iterator
+
+from fsm import GazeTarget
+
+
+LATENCY_WINDOW = 1000
+# a stream request is ended after this long, the tracker then starts a new one; uvicorn waits for open
+# requests before the shutdown that writes the session files (see live_events.STREAM_SECONDS)
+STREAM_SECONDS = 10
+
+
+class GazeStreamMessage:
+    def __init__(self, seq: int, target: GazeTarget, captured_at: float | None):
+        self.seq = seq
+        self.target = target
+        self.captured_at = captured_at
+
+
+class GazeStreamDecoder:
+    """Decodes one newline-delimited JSON stream of gaze targets.
+
+    Every line is `{"seq": int, "target": str, "captured_at": float}` with `captured_at` in seconds since
+    the epoch. Messages that arrive with a sequence number not above the last accepted one are dropped as stale.
+    """
+
+    def __init__(self):
+        self.buffer = b""
+        self.last_seq: int | None = None
+        self.received = 0
+        self.stale = 0
+        self.invalid = 0
+        self.capture_latencies_ms: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def feed(self, chunk: bytes) -> Iterator[GazeStreamMessage]:
+        self.buffer += chunk
+        *lines, self.buffer = self.buffer.split(b"\n")
+        for line in lines:
+            if not line.strip():
+                continue
+            message = self.__decode(line)
+            if message:
+                yield message
+
+    def __decode(self, line: bytes) -> GazeStreamMessage | None:
+        self.received += 1
+        try:
+            data = json.loads(line)
+            message = GazeStreamMessage(int(data["seq"]), GazeTarget(data["target"]), data.get("captured_at"))
+        except (ValueError, KeyError, TypeError):
+            self.invalid += 1
+            return None
+
+        if self.last_seq is not None and message.seq <= self.last_seq:
+            self.stale += 1
+            return None
+        self.last_seq = message.seq
+
+        if message.captured_at:
+            self.capture_latencies_ms.append((time.time() - message.captured_at) * 1000)
+        return message
+
+    def summary(self) -> dict:
+        latencies = sorted(self.capture_latencies_ms)
+        return {
+            "received": self.received,
+            "stale": self.stale,
+            "invalid": self.invalid,
+            "last_seq": self.last_seq,
+            "capture_latency_p50_ms": latencies[len(latencies) // 2] if latencies else None,
+            "capture_latency_max_ms": latencies[-1] if latencies else None,
+        }
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import AsyncIterator, Callable, Deque, List
+
+
+HISTORY_SIZE = 256
+# a stream ends after this long and the browser reconnects with Last-Event-ID; an open stream would
+# otherwise keep the server from shutting down, which is when the session files are written
+STREAM_SECONDS = 5
+RECONNECT_MS = 250
+
+
+class LiveEvent:
+    def __init__(self, epoch: str, event_id: int, kind: str, data: dict):
+        self.epoch = epoch
+        self.event_id = event_id
+        self.kind = kind
+        self.data = data
+
+    def encode(self) -> str:
+        """Server-Sent Events wire format"""
+
+        return f"id: {self.epoch}:{self.event_id}\nevent: {self.kind}\ndata: {json.dumps(self.data)}\n\n"
+
+
+class LiveEventHub:
+    """Fans out live session events to Server-Sent Events subscribers.
+
+    Each subscriber has a bounded queue; a subscriber that does not keep up loses its oldest events
+    instead of slowing down the session. The most recent events are kept so a reconnecting
+    subscriber resumes where it left off.
+    """
+
+    def __init__(self):
+        self.subscribers: List[asyncio.Queue] = []
+        self.history: Deque[LiveEvent] = deque(maxlen=HISTORY_SIZE)
+        self.last_event_id = 0
+        # distinguishes the event ids of this hub from those of an earlier server run
+        self.epoch = uuid.uuid4().hex[:8]
+
+    def publish(self, kind: str, data: dict) -> None:
+        """Must be called on the event loop"""
+
+        self.last_event_id += 1
+        event = LiveEvent(self.epoch, self.last_event_id, kind, {"time": datetime.now().isoformat(), **data})
+        self.history.append(event)
+        for queue in self.subscribers:
+            self.__put(queue, event)
+
+    def close(self) -> None:
+        """Ends every open stream"""
+
+        for queue in self.subscribers:
+            self.__put(queue, None)
+
+    async def stream(self, snapshot: Callable[[], dict], last_event_id: str | None = None) -> AsyncIterator[str]:
+        """Yields the events after `last_event_id` (the browser's Last-Event-ID), or a `state` snapshot if they
+        are no longer known, followed by every published event until the stream times out, the hub is closed
+        or the client disconnects.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=HISTORY_SIZE)
+        self.subscribers.append(queue)
+        try:
+            yield f"retry: {RECONNECT_MS}\n\n"
+            resume_after = self.__resume_after(last_event_id)
+            if resume_after is None:
+                yield LiveEvent(self.epoch, self.last_event_id, "state", snapshot()).encode()
+            else:
+                for event in self.history:
+                    if event.event_id > resume_after:
+                        yield event.encode()
+
+            deadline = asyncio.get_running_loop().time() + STREAM_SECONDS
+            while True:
+                remaining = deadline - asyncio.get_running_loop().time()
+                try:
+                    event = await asyncio.wait_for(queue.get(), max(remaining, 0))
+                except asyncio.TimeoutError:
+                    return
+                if event is None:
+                    return
+                yield event.encode()
+        finally:
+            self.subscribers.remove(queue)
+
+    def __resume_after(self, last_event_id: str | None) -> int | None:
+        """Returns the event id to resume after, None if the events since `last_event_id` are not all known"""
+
+        epoch, _, event_id = (last_event_id or "").partition(":")
+        if epoch != self.epoch or not event_id.isdigit():
+            return None
+        resume_after = int(event_id)
+        oldest = self.history[0].event_id if self.history else self.last_event_id + 1
+        if resume_after > self.last_event_id or oldest > resume_after + 1:
+            return None
+        return resume_after
+
+    @staticmethod
+    def __put(queue: asyncio.Queue, event: LiveEvent | None) -> None:
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
@@ -1,21 +1,23 @@
+import asyncio
 import os
+import time
 import uuid
-from fastapi import FastAPI, BackgroundTasks, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi_utils.tasks import repeat_every
 from pydantic import BaseModel
 from fsm import (
-    StateMachine, StateUpdate,
-    GazeTarget, ArmLocation, HandoverInitiatedTray
+    StateUpdate,
+    GazeTarget, ArmLocation, HandoverInitiatedTray,
+    load_policy, DEFAULT_POLICY_PATH
 )
-from notifier import notify_arm_program, notify_gaze_program
+from gaze_stream import GazeStreamDecoder, STREAM_SECONDS
+from sessions import Session, SessionRegistry, DEFAULT_SESSION_ID
 from data_logger import DataLogger
+from gaze_filter import COALESCE_WINDOW_MS, HYSTERESIS_MS
+import metrics
 
 
-participant_identifier=os.getenv("PARTICIPANT_IDENTIFIER", str(uuid.uuid4()))
-dynamic_gaze=os.getenv("DYNAMIC_GAZE", "false").lower() == "true"
-demonstration=os.getenv("DEMONSTRATION", "false").lower() == "true"
-
 app = FastAPI()
 
 app.add_middleware(
@@ -26,78 +28,218 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-logger = DataLogger(participant_identifier=participant_identifier, dynamic_gaze=dynamic_gaze, demonstration=demonstration)
-sm = StateMachine(logger=logger, dynamic_gaze=dynamic_gaze)
+# validated and compiled once at startup, shared by every session's state machine
+policy = load_policy(os.getenv("TRANSITION_POLICY", DEFAULT_POLICY_PATH))
+# sessions are stored in the columnar session store, CSV files are only exported on request
+export_csv = os.getenv("EXPORT_CSV", "false").lower() == "true"
 
-def print_config() -> None:
-    print(f"Identifier: {participant_identifier}")
-    print(f"Dynamic Gaze: {dynamic_gaze}")
-    print(f"Demonstration: {demonstration}")
+registry = SessionRegistry()
+# the default session is configured through the environment and serves the unscoped routes
+registry.add(Session(
+    session_id=DEFAULT_SESSION_ID,
+    participant_identifier=os.getenv("PARTICIPANT_IDENTIFIER", str(uuid.uuid4())),
+    dynamic_gaze=os.getenv("DYNAMIC_GAZE", "false").lower() == "true",
+    demonstration=os.getenv("DEMONSTRATION", "false").lower() == "true",
+    policy=policy,
+    gaze_window_ms=float(os.getenv("GAZE_WINDOW_MS", COALESCE_WINDOW_MS)),
+    gaze_hysteresis_ms=float(os.getenv("GAZE_HYSTERESIS_MS", HYSTERESIS_MS)),
+    export_csv=export_csv,
+))
 
-@app.on_event("startup")
-async def startup_event():
-    print("Starting State Machine ...\n")
-    print_config()
+metrics.registry.register(metrics.Gauge(
+    "state_machine_queue_depth", "Updates waiting in the actor queue per lane", ("session", "lane"),
+    collect=lambda: {
+        (session_id, lane.label): depth
+        for session_id, session in registry.sessions.items() if session.actor.queue
+        for lane, depth in session.actor.queue.depths().items()
+    },
+))
 
 
-@app.on_event("startup")
-@repeat_every(seconds=1)
-def state_machine_loop() -> None:
-    """Calls _process_update repeatedly in the background to trigger update-independent state changes"""
+def get_session(session_id: str) -> Session:
+    session = registry.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="unknown session")
+    return session
+
+def check_file_name(file_name: str, session_id: str) -> None:
+    owner = registry.file_name_owner(file_name)
+    if owner is not None and owner != session_id:
+        raise HTTPException(status_code=409, detail=f"session {owner} already logs to {file_name}")
+
+async def submit_update(session: Session, update: StateUpdate, wait: bool, response: Response) -> dict:
+    """With `wait` the update is applied before responding and the response carries the resulting transition"""
 
-    _process_update(StateUpdate(state_loop_update=True))
+    if not wait:
+        session.actor.submit(update)
+        return {"status": "accepted"}
+    result = await session.actor.apply(update)
+    response.status_code = 200
+    return {"status": "processed", **result.to_dict()}
+
+def duplicate(response: Response) -> dict:
+    """The request was already accepted, a retry is acknowledged without being applied again"""
+
+    response.status_code = 200
+    return {"status": "duplicate"}
+
+@app.on_event("startup")
+async def startup_event():
+    print("Starting State Machine ...\n")
+    registry.start(asyncio.get_running_loop())
 
 
 @app.on_event("shutdown")
-def shutdown_event():
-    logger.write_files()
+async def shutdown_event():
+    await registry.stop()
 
 class ConfigPayload(BaseModel):
     participant_identifier: str | None
     dynamic_gaze: bool | None
     demonstration: bool | None
 
+# Senders may retry on short timeouts: a sender id unique to the sending process and a sequence number
+# increasing per request identify a request, a retry carries both again and is dropped as duplicate
+# (see dedupe.py). Requests without them are always accepted.
 class GazeTargetPayload(BaseModel):
     target: GazeTarget
+    seq: int | None = None
+    sender: str | None = None
 
 class ArmLocationPayload(BaseModel):
     location: ArmLocation
+    seq: int | None = None
+    sender: str | None = None
 
 class EventPayload(BaseModel):
     name: str
+    seq: int | None = None
+    sender: str | None = None
+
+class SessionPayload(BaseModel):
+    session_id: str
+    participant_identifier: str | None = None
+    dynamic_gaze: bool = False
+    demonstration: bool = False
+    robot_controller_url: str | None = None
+    gaze_animation_url: str | None = None
+    gaze_window_ms: float = COALESCE_WINDOW_MS
+    gaze_hysteresis_ms: float = HYSTERESIS_MS
 
 @app.get("/", status_code=200)
 async def status():
     return {"status": "ok"}
 
-@app.post("/config", status_code=202)
-async def change_config(data: ConfigPayload):
-    global participant_identifier, dynamic_gaze, demonstration, sm, logger
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return metrics.registry.render()
+
+@app.get("/sessions", status_code=200)
+async def list_sessions():
+    return {session_id: session.config() for session_id, session in registry.sessions.items()}
+
+@app.post("/sessions", status_code=201)
+async def create_session(data: SessionPayload):
+    if registry.get(data.session_id):
+        raise HTTPException(status_code=409, detail="session already exists")
+    participant_identifier = data.participant_identifier or str(uuid.uuid4())
+    check_file_name(DataLogger.create_base_file_name(participant_identifier, data.dynamic_gaze, data.demonstration), data.session_id)
+    urls = {
+        key: value for key, value in (
+            ("robot_controller_url", data.robot_controller_url),
+            ("gaze_animation_url", data.gaze_animation_url),
+        ) if value
+    }
+    session = Session(
+        session_id=data.session_id,
+        participant_identifier=participant_identifier,
+        dynamic_gaze=data.dynamic_gaze,
+        demonstration=data.demonstration,
+        policy=policy,
+        gaze_window_ms=data.gaze_window_ms,
+        gaze_hysteresis_ms=data.gaze_hysteresis_ms,
+        export_csv=export_csv,
+        **urls,
+    )
+    registry.add(session)
+    return {"status": "created", "session_id": session.session_id, "config": session.config()}
 
-    if data.participant_identifier and data.participant_identifier != participant_identifier:
-        participant_identifier = data.participant_identifier
+@app.delete("/sessions/{session_id}", status_code=200)
+async def delete_session(session_id: str):
+    get_session(session_id)
+    await registry.remove(session_id)
+    return {"status": "removed"}
 
-    if data.dynamic_gaze != dynamic_gaze:
-        dynamic_gaze = data.dynamic_gaze
-        sm = StateMachine(dynamic_gaze=dynamic_gaze)
+@app.get("/gaze_filter", status_code=200)
+@app.get("/sessions/{session_id}/gaze_filter", status_code=200)
+async def gaze_filter_summary(session_id: str = DEFAULT_SESSION_ID):
+    return get_session(session_id).gaze_filter.summary()
 
-    if data.demonstration != demonstration:
-        demonstration = data.demonstration
+@app.get("/stream")
+@app.get("/sessions/{session_id}/stream")
+async def live_stream(session_id: str = DEFAULT_SESSION_ID, last_event_id: str | None = Header(None)):
+    """Server-Sent Events: the current state, then every transition, gaze target, arm location and notifier failure"""
 
-    logger.update_file_name(participant_identifier, dynamic_gaze, demonstration)
-    print_config()
+    session = get_session(session_id)
+    return StreamingResponse(
+        session.live.stream(lambda: {"session_id": session_id, "config": session.config(), **session.state()}, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    return {"status": "accepted", "new_config": {"participant_identifier": participant_identifier, "dynamic_gaze": dynamic_gaze, "demonstration": demonstration}}
+@app.get("/notifier", status_code=200)
+@app.get("/sessions/{session_id}/notifier", status_code=200)
+async def notifier_metrics(session_id: str = DEFAULT_SESSION_ID):
+    return get_session(session_id).notifier.metrics()
+
+@app.post("/config", status_code=202)
+@app.post("/sessions/{session_id}/config", status_code=202)
+async def change_config(data: ConfigPayload, session_id: str = DEFAULT_SESSION_ID):
+    session = get_session(session_id)
+    check_file_name(session.file_name(data.participant_identifier, data.dynamic_gaze, data.demonstration), session_id)
+    await session.configure(data.participant_identifier, data.dynamic_gaze, data.demonstration)
+    return {"status": "accepted", "new_config": session.config()}
 
 @app.post("/gaze_target", status_code=202)
-async def update_gaze_target(data: GazeTargetPayload, bg: BackgroundTasks):
-    logger.log_gaze_target(data.target.value)
-    upd = StateUpdate(new_gaze_target=data.target)
-    bg.add_task(_process_update, upd)
+@app.post("/sessions/{session_id}/gaze_target", status_code=202)
+async def update_gaze_target(data: GazeTargetPayload, response: Response, session_id: str = DEFAULT_SESSION_ID):
+    received_at = time.perf_counter()
+    session = get_session(session_id)
+    metrics.EVENTS_RECEIVED.inc(session_id, "gaze_target")
+    if not session.dedupe.accept(data.sender, data.seq, "gaze_target"):
+        return duplicate(response)
+    session.submit_gaze_target(data.target, data.seq, data.sender, received_at)
     return {"status": "accepted"}
 
+@app.post("/gaze_stream", status_code=200)
+@app.post("/sessions/{session_id}/gaze_stream", status_code=200)
+async def stream_gaze_targets(request: Request, session_id: str = DEFAULT_SESSION_ID):
+    """Long-lived alternative to /gaze_target: one chunked request body carrying newline-delimited JSON gaze targets.
+
+    The request is ended after STREAM_SECONDS even if the body is not complete yet, the tracker then reconnects.
+    """
+
+    session = get_session(session_id)
+    decoder = GazeStreamDecoder()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + STREAM_SECONDS
+    chunks = request.stream().__aiter__()
+    while (remaining := deadline - loop.time()) > 0:
+        try:
+            chunk = await asyncio.wait_for(chunks.__anext__(), remaining)
+        except (StopAsyncIteration, asyncio.TimeoutError):
+            break
+        received_at = time.perf_counter()
+        for message in decoder.feed(chunk):
+            metrics.EVENTS_RECEIVED.inc(session_id, "gaze_target")
+            # the decoder already drops messages that are stale within this stream
+            session.submit_gaze_target(message.target, received_at=received_at)
+    return decoder.summary()
+
 @app.post("/event", status_code=202)
-async def trigger_event(data: EventPayload, bg: BackgroundTasks):
+@app.post("/sessions/{session_id}/event", status_code=202)
+async def trigger_event(data: EventPayload, response: Response, session_id: str = DEFAULT_SESSION_ID, wait: bool = False):
+    session = get_session(session_id)
     if data.name == "handover_start_detected_left":
         upd = StateUpdate(handover_start_detected=HandoverInitiatedTray.LEFT)
     elif data.name == "handover_start_detected_right":
@@ -111,23 +253,24 @@ async def trigger_event(data: EventPayload, bg: BackgroundTasks):
     elif data.name == "gaze_program_finished":
         upd = StateUpdate(gaze_program_finished=True)
     elif data.name == "task_completed":
-        logger.log_task_completed()
         upd = StateUpdate(task_completed=True)
     else:
+        # client strings become label values, unknown names share one series
+        metrics.EVENTS_RECEIVED.inc(session_id, "unknown")
         raise HTTPException(status_code=400, detail="unknown event")
-    bg.add_task(_process_update, upd)
-    return {"status": "accepted"}
 
-@app.post("/arm_location", status_code=202)
-async def update_arm_location(data: ArmLocationPayload, bg: BackgroundTasks):
-    upd = StateUpdate(new_arm_location=data.location)
-    bg.add_task(_process_update, upd)
-    return {"status": "accepted"}
+    metrics.EVENTS_RECEIVED.inc(session_id, data.name)
+    if not session.dedupe.accept(data.sender, data.seq, data.name):
+        return duplicate(response)
+    if upd.task_completed:
+        session.logger.log_task_completed()
+    return await submit_update(session, upd, wait, response)
 
-def _process_update(update: StateUpdate):
-    changes = sm.update_state(update)
-    print(f"Changes: {changes.__dict__}" )
-    if changes.arm_program:
-        notify_arm_program(changes.arm_program)
-    if changes.gaze_program:
-        notify_gaze_program(changes.gaze_program)
+@app.post("/arm_location", status_code=202)
+@app.post("/sessions/{session_id}/arm_location", status_code=202)
+async def update_arm_location(data: ArmLocationPayload, response: Response, session_id: str = DEFAULT_SESSION_ID, wait: bool = False):
+    session = get_session(session_id)
+    metrics.EVENTS_RECEIVED.inc(session_id, "arm_location")
+    if not session.dedupe.accept(data.sender, data.seq, "arm_location"):
+        return duplicate(response)
+    return await submit_update(session, StateUpdate(new_arm_location=data.location), wait, response)
@@ -0,0 +1,153 @@
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Tuple
+
+
+LabelValues = Tuple[str, ...]
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 8, 13)
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label_value(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, description: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self.lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+
+    @abstractmethod
+    def render(self) -> List[str]:
+        ...
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, description, labelnames)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self.lock:
+            return self.header() + [
+                f"{self.name}{format_labels(self.labelnames, labels)} {value}"
+                for labels, value in self.values.items()
+            ]
+
+
+class Gauge(Metric):
+    """Gauge whose values are collected at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, labelnames: Tuple[str, ...], collect: Callable[[], Dict[LabelValues, float]]):
+        super().__init__(name, description, labelnames)
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{format_labels(self.labelnames, labels)} {value}"
+            for labels, value in self.collect().items()
+        ]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = buckets
+        # per label set: [count per bucket (+Inf last), sum, count]
+        self.values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        with self.lock:
+            for labels, (bucket_counts, total, count) in self.values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(list(self.buckets) + ["+Inf"], bucket_counts):
+                    cumulative += bucket_count
+                    le = f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{format_labels(self.labelnames, labels, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {total}")
+                lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+registry = MetricsRegistry()
+
+EVENTS_RECEIVED = registry.register(Counter(
+    "state_machine_events_received_total", "Events received per type", ("session", "type")
+))
+EVENT_TO_TRANSITION = registry.register(Histogram(
+    "state_machine_event_to_transition_seconds", "Time from receiving an update, including the gaze filter hold, to its transition being applied per lane", ("session", "lane")
+))
+QUEUE_WAIT = registry.register(Histogram(
+    "state_machine_queue_wait_seconds", "Time an update waited in the actor queue per lane", ("session", "lane")
+))
+GUARD_EVALUATIONS = registry.register(Histogram(
+    "state_machine_guard_evaluations", "Transition guards evaluated per update", ("session",), buckets=COUNT_BUCKETS
+))
+NOTIFIER_LATENCY = registry.register(Histogram(
+    "state_machine_notifier_latency_seconds", "Delivery latency per downstream service", ("session", "service")
+))
+NOTIFIER_FAILURES = registry.register(Counter(
+    "state_machine_notifier_failures_total", "Failed deliveries per downstream service", ("session", "service")
+))
+NOTIFIER_DROPPED = registry.register(Counter(
+    "state_machine_notifier_dropped_total", "Programs dropped from a full outbox per downstream service", ("session", "service")
+))
+GAZE_TARGETS_COLLAPSED = registry.register(Counter(
+    "state_machine_gaze_targets_collapsed_total", "Gaze targets coalesced or suppressed before reaching the state machine", ("session",)
+))
+GAZE_TARGETS_STALE = registry.register(Counter(
+    "state_machine_gaze_targets_stale_total", "Gaze targets dropped for an outdated sequence number", ("session",)
+))
+EVENTS_DUPLICATE = registry.register(Counter(
+    "state_machine_events_duplicate_total", "Retried requests dropped by sender sequence number per type", ("session", "type")
+))
@@ -1,21 +1,172 @@
+import asyncio
+import time
+from typing import Callable, Dict
+
 import requests
 from fsm import ArmProgram, GazeProgram
+from metrics import NOTIFIER_LATENCY, NOTIFIER_FAILURES, NOTIFIER_DROPPED
 
 ROBOT_CONTROLLER_URL = "http://0.0.0.0:3333/start"
 GAZE_ANIMATION_URL   = "http://0.0.0.0:2222/trigger"
 
-def notify_arm_program(prog: ArmProgram):
-    try:
-        requests.post(ROBOT_CONTROLLER_URL, json={"program": prog.value}, timeout=0.5)
-        print("To Robot Controller:", "{'program':", prog.value, "}")
-    except Exception as e:
-        print("ERROR while sending data to robot controller: ", str(e))
-        pass
-
-def notify_gaze_program(prog: GazeProgram):
-    try:
-        requests.post(GAZE_ANIMATION_URL, json={"program": prog.value}, timeout=0.5)
-        print("To Gaze Animation:", "{'program':", prog.value, "}")
-    except Exception as e:
-        print("ERROR while sending data to gaze animation: ", str(e))
-        pass
+REQUEST_TIMEOUT = 0.5
+OUTBOX_SIZE = 16
+
+
+class ServiceMetrics:
+    def __init__(self, session_id: str, service: str):
+        self.labels = (session_id, service)
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.last_latency_ms: float | None = None
+        self.max_latency_ms: float | None = None
+        self.total_latency_ms = 0.0
+
+    def record(self, latency_ms: float, success: bool) -> None:
+        if success:
+            self.sent += 1
+        else:
+            self.failed += 1
+            NOTIFIER_FAILURES.inc(*self.labels)
+        NOTIFIER_LATENCY.observe(latency_ms / 1000, *self.labels)
+        self.last_latency_ms = latency_ms
+        self.max_latency_ms = max(self.max_latency_ms or 0.0, latency_ms)
+        self.total_latency_ms += latency_ms
+
+    def record_dropped(self) -> None:
+        self.dropped += 1
+        NOTIFIER_DROPPED.inc(*self.labels)
+
+    def to_dict(self) -> dict:
+        attempts = self.sent + self.failed
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "last_latency_ms": self.last_latency_ms,
+            "max_latency_ms": self.max_latency_ms,
+            "mean_latency_ms": self.total_latency_ms / attempts if attempts else None,
+        }
+
+
+class ServiceChannel:
+    """Delivers programs to one downstream service in order over a persistent keep-alive connection.
+
+    With `superseded`, programs describe a state that a newer one replaces (gaze animations): the outbox is
+    bounded and when it is full the oldest pending program is dropped. Otherwise programs are commands that
+    each have to be carried out (arm programs) and none is ever dropped, not even by stop().
+    """
+
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        metrics: ServiceMetrics,
+        on_failure: Callable[[str, str], None] | None = None,
+        superseded: bool = False,
+    ):
+        self.name = name
+        self.url = url
+        self.superseded = superseded
+        self.on_failure = on_failure
+        self.session = requests.Session()
+        self.outbox: asyncio.Queue | None = None
+        self.worker: asyncio.Task | None = None
+        self.metrics = metrics
+
+    def start(self) -> None:
+        self.outbox = asyncio.Queue(maxsize=OUTBOX_SIZE if self.superseded else 0)
+        self.worker = asyncio.get_running_loop().create_task(self.__deliver())
+
+    async def stop(self) -> None:
+        if self.worker:
+            if self.superseded:
+                self.worker.cancel()
+            else:
+                # queued behind the programs still being submitted through call_soon_threadsafe, which are
+                # delivered before the worker ends
+                asyncio.get_running_loop().call_soon(self.outbox.put_nowait, None)
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+        self.session.close()
+
+    def put(self, program: str) -> None:
+        """Must be called on the event loop"""
+
+        if self.superseded and self.outbox.full():
+            self.outbox.get_nowait()
+            self.metrics.record_dropped()
+        self.outbox.put_nowait(program)
+
+    def __post(self, program: str) -> None:
+        self.session.post(self.url, json={"program": program}, timeout=REQUEST_TIMEOUT)
+
+    async def __deliver(self) -> None:
+        while True:
+            program = await self.outbox.get()
+            if program is None:
+                return
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(self.__post, program)
+                self.metrics.record((time.perf_counter() - start) * 1000, True)
+                print(f"To {self.name}:", "{'program':", program, "}")
+            except Exception as e:
+                self.metrics.record((time.perf_counter() - start) * 1000, False)
+                print(f"ERROR while sending data to {self.name}: ", str(e))
+                if self.on_failure:
+                    self.on_failure(program, str(e))
+
+
+class Notifier:
+    """Non-blocking outbound notifications to the robot controller (3333) and the gaze animation (2222)"""
+
+    def __init__(
+        self,
+        robot_controller_url: str = ROBOT_CONTROLLER_URL,
+        gaze_animation_url: str = GAZE_ANIMATION_URL,
+        session_id: str = "default",
+        on_failure: Callable[[str, str, str], None] | None = None,
+    ):
+        """`on_failure(service, program, error)` is called on the event loop for every failed delivery"""
+
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.channels: Dict[str, ServiceChannel] = {
+            service: ServiceChannel(
+                name,
+                url,
+                ServiceMetrics(session_id, service),
+                (lambda program, error, service=service: on_failure(service, program, error)) if on_failure else None,
+                superseded,
+            )
+            for service, name, url, superseded in (
+                ("robot_controller", "Robot Controller", robot_controller_url, False),
+                ("gaze_animation", "Gaze Animation", gaze_animation_url, True),
+            )
+        }
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+        for channel in self.channels.values():
+            channel.start()
+
+    async def stop(self) -> None:
+        for channel in self.channels.values():
+            await channel.stop()
+
+    def __submit(self, channel: ServiceChannel, program: str) -> None:
+        # callable from any thread, the outbox itself is only touched on the event loop
+        if self.loop and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(channel.put, program)
+
+    def notify_arm_program(self, prog: ArmProgram) -> None:
+        self.__submit(self.channels["robot_controller"], prog.value)
+
+    def notify_gaze_program(self, prog: GazeProgram) -> None:
+        self.__submit(self.channels["gaze_animation"], prog.value)
+
+    def metrics(self) -> dict:
+        return {name: channel.metrics.to_dict() for name, channel in self.channels.items()}
@@ -0,0 +1,143 @@
+"""Replays recorded sessions through the state machine under a virtual clock.
+
+Every `state_update` record of an event log is fed into a fresh StateMachine at its recorded time.
+Timeout transitions are fired at exactly their deadline, like the deadline scheduler does live, so a
+session replays in a fraction of its real duration. The resulting transitions are compared with the
+recorded `transition` records, which makes the tool usable as a regression check for policy changes:
+
+    python replay.py output/*_events.jsonl
+    python replay.py --policy candidate.json output/*_events.jsonl
+
+fixtures/random_sessions_events.jsonl holds random sessions recorded with the transition tables the spec
+was generated from (see fixtures/record_sessions.py), a replay of it must always reproduce.
+"""
+import argparse
+import sys
+import time
+from datetime import datetime
+from typing import List, Tuple
+
+from clock import VirtualClock
+from event_log import read_event_log
+from fsm import StateMachine, StateUpdate, UpdatedState, TransitionPolicy, load_policy, DEFAULT_POLICY_PATH
+
+
+class ReplayLogger:
+    """Stands in for the DataLogger, a replay must not write session data"""
+
+    def log_handover_initiation(self) -> None:
+        pass
+
+    def log_object_in_bowl(self) -> None:
+        pass
+
+    def log_handover_error(self) -> None:
+        pass
+
+
+class ReplayResult:
+    def __init__(self, path: str):
+        self.path = path
+        self.updates = 0
+        self.transitions: List[dict] = []
+        self.recorded_transitions: List[dict] = []
+        self.session_seconds = 0.0
+        self.replay_seconds = 0.0
+
+    def first_mismatch(self) -> int | None:
+        for index, (replayed, recorded) in enumerate(zip(self.transitions, self.recorded_transitions)):
+            if replayed != recorded:
+                return index
+        if len(self.transitions) != len(self.recorded_transitions):
+            return min(len(self.transitions), len(self.recorded_transitions))
+        return None
+
+
+class SessionReplay:
+    def __init__(self, start: datetime, dynamic_gaze: bool, policy: TransitionPolicy | None = None):
+        self.clock = VirtualClock(start)
+        self.sm = StateMachine(logger=ReplayLogger(), dynamic_gaze=dynamic_gaze, clock=self.clock, policy=policy)
+        self.transitions: List[Tuple[datetime, dict]] = []
+
+    def __apply(self, update: StateUpdate) -> None:
+        changes: UpdatedState = self.sm.update_state(update)
+        if changes.handover_state or changes.gaze_program or changes.arm_program:
+            self.transitions.append((self.clock.now(), changes.to_dict()))
+
+    def advance_to(self, timestamp: datetime) -> None:
+        """Fires every timeout transition that becomes due up to `timestamp`"""
+
+        deadline = self.sm.next_deadline()
+        while deadline is not None and deadline <= timestamp:
+            self.clock.advance_to(deadline)
+            self.__apply(StateUpdate(state_loop_update=True))
+            next_deadline = self.sm.next_deadline()
+            if next_deadline == deadline:
+                break
+            deadline = next_deadline
+        self.clock.advance_to(timestamp)
+
+    def apply(self, timestamp: datetime, update: StateUpdate) -> None:
+        self.advance_to(timestamp)
+        self.__apply(update)
+
+
+def replay_session(path: str, dynamic_gaze: bool | None = None, policy: TransitionPolicy | None = None) -> ReplayResult:
+    result = ReplayResult(path)
+    records = list(read_event_log(path))
+    if not records:
+        return result
+
+    start = time.perf_counter()
+    replay: SessionReplay | None = None
+    for record in records:
+        if record["type"] == "session" or replay is None:
+            # a restarted server starts over with a fresh state machine
+            if replay:
+                result.transitions += [changes for _, changes in replay.transitions]
+            mode = dynamic_gaze if dynamic_gaze is not None else record.get("dynamic_gaze", "_dynamic" in path)
+            replay = SessionReplay(record["time"], mode, policy)
+
+        if record["type"] == "state_update":
+            replay.apply(record["time"], StateUpdate.from_dict(record["update"]))
+            result.updates += 1
+        elif record["type"] == "transition":
+            result.recorded_transitions.append(record["changes"])
+
+    replay.advance_to(records[-1]["time"])
+    result.transitions += [changes for _, changes in replay.transitions]
+    result.replay_seconds = time.perf_counter() - start
+    result.session_seconds = (records[-1]["time"] - records[0]["time"]).total_seconds()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded sessions through the state machine")
+    parser.add_argument("event_logs", nargs="+", help="event logs (<identifier>_<dynamic|static>[_demo]_events.jsonl)")
+    gaze_mode = parser.add_mutually_exclusive_group()
+    gaze_mode.add_argument("--dynamic", dest="dynamic_gaze", action="store_true", default=None, help="replay with dynamic gaze")
+    gaze_mode.add_argument("--static", dest="dynamic_gaze", action="store_false", help="replay with static gaze")
+    parser.add_argument("--policy", default=DEFAULT_POLICY_PATH, help="transition spec to replay with (default: transitions.json)")
+    parser.add_argument("--verbose", action="store_true", help="print the replayed transitions")
+    args = parser.parse_args()
+
+    policy = load_policy(args.policy)
+    mismatches = 0
+    for path in args.event_logs:
+        result = replay_session(path, args.dynamic_gaze, policy)
+        mismatch = result.first_mismatch()
+        speedup = result.session_seconds / result.replay_seconds if result.replay_seconds else 0
+        status = "OK" if mismatch is None else f"MISMATCH at transition {mismatch + 1}"
+        print(f"{path}: {status} ({result.updates} updates, {len(result.transitions)} transitions, {speedup:,.0f}x real time)")
+        if mismatch is not None:
+            mismatches += 1
+            recorded = result.recorded_transitions[mismatch] if mismatch < len(result.recorded_transitions) else None
+            replayed = result.transitions[mismatch] if mismatch < len(result.transitions) else None
+            print(f"    recorded: {recorded}")
+            print(f"    replayed: {replayed}")
+        if args.verbose:
+            for changes in result.transitions:
+                print(f"    {changes}")
+
+    print(f"\n{len(args.event_logs) - mismatches}/{len(args.event_logs)} sessions reproduced")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,59 @@
+import asyncio
+from datetime import datetime
+from typing import Callable
+
+
+# lower bound for a timer delay, keeps a deadline that is due but not yet reached by the guard clock from spinning
+MIN_DELAY_SECONDS = 0.001
+
+
+class DeadlineScheduler:
+    """Keeps a single event loop timer armed for the next deadline reported by `next_deadline`.
+
+    Nothing is scheduled while there is no pending deadline, so an idle state machine never wakes up.
+    """
+
+    def __init__(self, next_deadline: Callable[[], datetime | None], on_deadline: Callable[[], None]):
+        self.next_deadline = next_deadline
+        self.on_deadline = on_deadline
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.timer: asyncio.TimerHandle | None = None
+        self.deadline: datetime | None = None
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+        self.rearm()
+
+    def stop(self) -> None:
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.__cancel)
+
+    def rearm(self) -> None:
+        """Recomputes the deadline on the event loop, safe to call from any thread"""
+
+        if self.loop and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.__arm)
+
+    def __cancel(self) -> None:
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        self.deadline = None
+
+    def __arm(self) -> None:
+        deadline = self.next_deadline()
+        if deadline == self.deadline and self.timer:
+            return
+
+        self.__cancel()
+        if deadline is None:
+            return
+
+        self.deadline = deadline
+        delay = max((deadline - datetime.now()).total_seconds(), MIN_DELAY_SECONDS)
+        self.timer = self.loop.call_later(delay, self.__fire)
+
+    def __fire(self) -> None:
+        self.timer = None
+        self.deadline = None
+        self.on_deadline()
@@ -0,0 +1,303 @@
+"""Columnar storage of a finished session.
+
+A session is a directory of `.npy` arrays that can be memory-mapped:
+
+    gaze_time.npy                 datetime64[ns], start of every gaze target
+    gaze_target.npy               uint8 code into the `gaze_targets` list of meta.json
+    handover_initiation.npy       datetime64[ns]
+    handover_object_in_bowl.npy   datetime64[ns], NaT if the object never reached the bowl
+    handover_error.npy            bool
+    meta.json                     written last, a directory without it is incomplete
+
+The CSV files are an optional export of this layout:
+
+    python session_store.py output/<identifier>_<dynamic|static>[_demo]
+
+A session directory is written from the session's event log when the server shuts down. The event log of a
+session that never got there, e.g. after a crash, is turned into a session directory (and CSV files) with:
+
+    python session_store.py --from-log output/<identifier>_<dynamic|static>[_demo]_events.jsonl [--csv]
+"""
+import argparse
+import csv
+import json
+import math
+import os
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from event_log import read_event_log
+
+
+STORE_VERSION = 1
+META_FILE = "meta.json"
+EVENT_LOG_SUFFIX = "_events.jsonl"
+ARRAYS = ["gaze_time", "gaze_target", "handover_initiation", "handover_object_in_bowl", "handover_error"]
+# gaze targets held in memory before a chunk is spilled to disk, 9 bytes each
+CHUNK_SIZE = 65536
+
+
+class GazeTimeline:
+    """Fixed-capacity array buffer for the gaze targets of one session.
+
+    A full buffer is spilled as a chunk file to `spill_directory` and reused, so memory stays at
+    CHUNK_SIZE records however long the session is. write() assembles the chunks into the final arrays.
+    """
+
+    def __init__(self, spill_directory: str, capacity: int = CHUNK_SIZE):
+        self.spill_directory = spill_directory
+        self.times = np.empty(capacity, dtype="datetime64[ns]")
+        self.codes = np.empty(capacity, dtype=np.uint8)
+        self.size = 0
+        self.chunks: List[str] = []
+        self.spilled = 0
+        # code of every target in order of first appearance
+        self.targets: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return self.spilled + self.size
+
+    def append(self, timestamp: datetime, target: str) -> None:
+        if self.size == len(self.times):
+            self.__spill()
+        code = self.targets.setdefault(target, len(self.targets))
+        self.times[self.size] = timestamp
+        self.codes[self.size] = code
+        self.size += 1
+
+    def write(self, directory: str) -> List[str]:
+        """Writes gaze_time.npy and gaze_target.npy chunk by chunk and returns the target code table"""
+
+        for name, buffer in (("gaze_time", self.times), ("gaze_target", self.codes)):
+            array = np.lib.format.open_memmap(os.path.join(directory, f"{name}.npy"), mode="w+", dtype=buffer.dtype, shape=(len(self),))
+            offset = 0
+            for chunk in self.chunks:
+                values = np.load(f"{chunk}_{name}.npy")
+                array[offset:offset + len(values)] = values
+                offset += len(values)
+            array[offset:] = buffer[:self.size]
+            array.flush()
+            del array
+        return list(self.targets)
+
+    def segment(self, spill_directory: str) -> None:
+        """Starts over for the session (participant) spilling to `spill_directory`"""
+
+        self.clear()
+        self.spill_directory = spill_directory
+
+    def clear(self) -> None:
+        """Deletes the spilled chunks and empties the buffer"""
+
+        for chunk in self.chunks:
+            for name in ("gaze_time", "gaze_target"):
+                os.remove(f"{chunk}_{name}.npy")
+        if self.chunks and not os.listdir(self.spill_directory):
+            os.rmdir(self.spill_directory)
+        self.chunks = []
+        self.spilled = 0
+        self.size = 0
+        self.targets = {}
+
+    def __spill(self) -> None:
+        os.makedirs(self.spill_directory, exist_ok=True)
+        chunk = os.path.join(self.spill_directory, f"{len(self.chunks):05d}")
+        np.save(f"{chunk}_gaze_time.npy", self.times)
+        np.save(f"{chunk}_gaze_target.npy", self.codes)
+        self.chunks.append(chunk)
+        self.spilled += self.size
+        self.size = 0
+
+
+def write_session(
+    directory: str,
+    gaze: GazeTimeline,
+    initiations: List[datetime],
+    objects_in_bowl: List[datetime | None],
+    errors: List[bool],
+    task_completed: datetime | None,
+) -> None:
+    os.makedirs(directory, exist_ok=True)
+    meta_path = os.path.join(directory, META_FILE)
+    # a rewrite that fails halfway must not leave the previous marker behind
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    targets = gaze.write(directory)
+    arrays = {
+        "handover_initiation": np.array(initiations, dtype="datetime64[ns]"),
+        "handover_object_in_bowl": np.array([t or "NaT" for t in objects_in_bowl], dtype="datetime64[ns]"),
+        "handover_error": np.array(errors, dtype=bool),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f"{name}.npy"), array)
+
+    with open(f"{meta_path}.tmp", "w") as meta_file:
+        json.dump({
+            "version": STORE_VERSION,
+            "gaze_targets": targets,
+            "task_completed": task_completed.isoformat() if task_completed else None,
+        }, meta_file)
+    os.replace(f"{meta_path}.tmp", meta_path)
+
+
+def write_session_from_log(event_log_path: str, directory: str, gaze: GazeTimeline | None = None) -> bool:
+    """Replays an event log into the session store at `directory`, returns False if it holds no handover or gaze data.
+
+    `gaze` is reused as the buffer for the gaze targets, so a caller writing many sessions keeps one buffer.
+    """
+    spill_directory = os.path.join(directory, "spill")
+    if gaze is None:
+        gaze = GazeTimeline(spill_directory)
+    else:
+        gaze.segment(spill_directory)
+    initiations: List[datetime] = []
+    objects_in_bowl: List[datetime | None] = []
+    errors: List[bool] = []
+    task_completed = None
+
+    try:
+        for record in read_event_log(event_log_path):
+            kind = record["type"]
+            if kind == "gaze_target":
+                gaze.append(record["time"], record["target"])
+            elif kind == "handover_initiation":
+                initiations.append(record["time"])
+                objects_in_bowl.append(None)
+                errors.append(False)
+            elif kind == "object_in_bowl" and initiations:
+                objects_in_bowl[-1] = record["time"]
+            elif kind == "handover_error" and initiations:
+                errors[-1] = True
+            elif kind == "task_completed":
+                task_completed = record["time"]
+
+        if not initiations and not len(gaze):
+            return False
+        write_session(directory, gaze, initiations, objects_in_bowl, errors, task_completed)
+        return True
+    finally:
+        # the buffer keeps its fixed capacity, the spilled chunks are no longer needed
+        gaze.clear()
+
+
+def is_session(directory: str) -> bool:
+    return os.path.isfile(os.path.join(directory, META_FILE))
+
+
+def milliseconds(delta: np.ndarray) -> np.ndarray:
+    """timedelta64 to float ms, NaT becomes NaN; rounds like timedelta.total_seconds() * 1000"""
+
+    ms = (delta.astype("timedelta64[us]").astype(np.int64) / 10**6) * 1000
+    ms[np.isnat(delta)] = np.nan
+    return ms
+
+
+class SessionData:
+    """The arrays of a stored session, memory-mapped unless `mmap` is False"""
+
+    def __init__(self, directory: str, mmap: bool = True):
+        self.directory = directory
+        with open(os.path.join(directory, META_FILE)) as meta_file:
+            meta = json.load(meta_file)
+        if meta["version"] != STORE_VERSION:
+            raise ValueError(f"{directory}: unsupported session store version {meta['version']}")
+
+        self.gaze_targets: List[str] = meta["gaze_targets"]
+        self.task_completed = np.datetime64(meta["task_completed"] or "NaT", "ns")
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if mmap else None))
+
+    def gaze_durations(self) -> np.ndarray:
+        """Time in ms until the next gaze target, NaN for the last one"""
+
+        return milliseconds(np.append(np.diff(self.gaze_time), np.timedelta64("NaT", "ns")))
+
+    def handover_durations(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Init-to-bowl, bowl-to-bowl and full duration in ms of every handover, NaN where unknown"""
+
+        initiation, object_in_bowl = self.handover_initiation, self.handover_object_in_bowl
+        init_to_bowl = milliseconds(object_in_bowl - initiation)
+        bowl_to_bowl = milliseconds(np.append(np.timedelta64("NaT", "ns"), np.diff(object_in_bowl)))
+        next_initiation = np.append(initiation[1:], self.task_completed)
+        full_duration = milliseconds(next_initiation - initiation)
+        return init_to_bowl, bowl_to_bowl, full_duration
+
+
+def optional(values: np.ndarray) -> list:
+    return [None if math.isnan(value) else value for value in values.tolist()]
+
+
+def timestamps(values: np.ndarray) -> List[datetime | None]:
+    return values.astype("datetime64[us]").tolist()
+
+
+def export_csv(session: SessionData, base_path: str) -> List[str]:
+    """Writes `<base_path>_handover.csv` and `<base_path>_gaze.csv`, returns the written paths"""
+
+    written = []
+    if len(session.handover_initiation):
+        init_to_bowl, bowl_to_bowl, full_duration = session.handover_durations()
+        rows = zip(
+            timestamps(session.handover_initiation),
+            timestamps(session.handover_object_in_bowl),
+            optional(init_to_bowl),
+            session.handover_error.tolist(),
+            optional(bowl_to_bowl),
+            optional(full_duration),
+        )
+        data = [["identifier", "initiation", "object_in_bowl", "init_to_bowl_duration", "error", "bowl_to_bowl_duration", "full_duration"]]
+        for index, (initiation, object_in_bowl, *durations) in enumerate(rows):
+            data.append([
+                f"handover_{index+1}",
+                initiation.isoformat(),
+                object_in_bowl.isoformat() if object_in_bowl else None,
+                durations[0],
+                durations[1] or None,
+                durations[2],
+                durations[3],
+            ])
+        written.append(write_csv(f"{base_path}_handover.csv", data))
+
+    if len(session.gaze_time):
+        targets = np.array(session.gaze_targets, dtype=str)[session.gaze_target]
+        data = [["target", "start_time", "duration"]]
+        data += zip(targets.tolist(), timestamps(session.gaze_time), optional(session.gaze_durations()))
+        written.append(write_csv(f"{base_path}_gaze.csv", data))
+    return written
+
+
+def write_csv(path: str, data: list) -> str:
+    with open(path, "w") as csv_file:
+        writer = csv.writer(csv_file, delimiter=',')
+        for line in data:
+            writer.writerow(line)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export stored sessions as CSV files, or store sessions from their event logs")
+    parser.add_argument("sessions", nargs="*", help="session directories (<identifier>_<dynamic|static>[_demo])")
+    parser.add_argument("--from-log", nargs="+", default=[], metavar="EVENT_LOG", help="event logs (<session directory>_events.jsonl) to store as sessions")
+    parser.add_argument("--csv", action="store_true", help="also export the sessions stored from event logs as CSV files")
+    args = parser.parse_args()
+    if not args.sessions and not args.from_log:
+        parser.error("no session directories or event logs given")
+
+    exports = [directory.rstrip("/") for directory in args.sessions]
+    for event_log_path in args.from_log:
+        if not event_log_path.endswith(EVENT_LOG_SUFFIX):
+            parser.error(f"{event_log_path} is not an event log (*{EVENT_LOG_SUFFIX})")
+        directory = event_log_path[:-len(EVENT_LOG_SUFFIX)]
+        if write_session_from_log(event_log_path, directory):
+            print(f"Stored {directory}")
+            if args.csv:
+                exports.append(directory)
+        else:
+            print(f"{event_log_path} has no handover or gaze data")
+
+    for directory in exports:
+        for path in export_csv(SessionData(directory), directory):
+            print(f"Written {path}")
@@ -0,0 +1,210 @@
+import asyncio
+from typing import Dict
+
+from fsm import StateMachine, StateUpdate, UpdatedState, GazeTarget, TransitionPolicy, load_policy
+from notifier import Notifier, ROBOT_CONTROLLER_URL, GAZE_ANIMATION_URL
+from data_logger import DataLogger
+from scheduler import DeadlineScheduler
+from actor import StateMachineActor
+from gaze_filter import GazeTargetFilter, COALESCE_WINDOW_MS, HYSTERESIS_MS
+from live_events import LiveEventHub
+from dedupe import Deduplicator
+
+
+DEFAULT_SESSION_ID = "default"
+
+
+class Session:
+    """One workcell: its own StateMachine, DataLogger, notifier, actor, deadline scheduler, gaze target filter, deduplicator and live event hub"""
+
+    def __init__(
+        self,
+        session_id: str,
+        participant_identifier: str,
+        dynamic_gaze: bool,
+        demonstration: bool,
+        robot_controller_url: str = ROBOT_CONTROLLER_URL,
+        gaze_animation_url: str = GAZE_ANIMATION_URL,
+        policy: TransitionPolicy | None = None,
+        gaze_window_ms: float = COALESCE_WINDOW_MS,
+        gaze_hysteresis_ms: float = HYSTERESIS_MS,
+        export_csv: bool = False,
+    ):
+        self.session_id = session_id
+        self.participant_identifier = participant_identifier
+        self.dynamic_gaze = dynamic_gaze
+        self.demonstration = demonstration
+        self.policy = policy or load_policy()
+
+        # serializes configuration changes and shutdown, state updates are serialized by the actor
+        self.lock = asyncio.Lock()
+
+        self.live = LiveEventHub()
+        self.logger = DataLogger(
+            participant_identifier=participant_identifier, dynamic_gaze=dynamic_gaze, demonstration=demonstration, export_csv=export_csv
+        )
+        self.notifier = Notifier(
+            robot_controller_url=robot_controller_url,
+            gaze_animation_url=gaze_animation_url,
+            session_id=session_id,
+            on_failure=lambda service, program, error: self.live.publish(
+                "notifier_failure", {"service": service, "program": program, "error": error}
+            ),
+        )
+        self.actor = StateMachineActor(
+            StateMachine(logger=self.logger, dynamic_gaze=dynamic_gaze, policy=self.policy), on_changes=self.__process_update, session_id=session_id
+        )
+        self.scheduler = DeadlineScheduler(next_deadline=lambda: self.actor.sm.next_deadline(), on_deadline=self.__on_deadline)
+        self.gaze_filter = GazeTargetFilter(
+            on_target=self.__on_gaze_target, window_ms=gaze_window_ms, hysteresis_ms=gaze_hysteresis_ms, session_id=session_id
+        )
+        self.dedupe = Deduplicator(session_id=session_id)
+
+    def __process_update(self, update: StateUpdate, changes: UpdatedState) -> None:
+        print(f"[{self.session_id}] Changes: {changes.to_dict()}")
+        # deadline ticks are not recorded, a replay regenerates them from the state machine's deadlines
+        if not update.state_loop_update:
+            self.logger.log_state_update(update.to_dict())
+        if update.new_arm_location:
+            self.live.publish("arm_location", {"location": update.new_arm_location.value})
+        if changes.handover_state or changes.gaze_program or changes.arm_program:
+            self.logger.log_transition(changes.to_dict())
+            self.live.publish("transition", {"changes": changes.to_dict(), **self.state()})
+        if changes.arm_program:
+            self.notifier.notify_arm_program(changes.arm_program)
+        if changes.gaze_program:
+            self.notifier.notify_gaze_program(changes.gaze_program)
+        self.scheduler.rearm()
+
+    def __on_deadline(self) -> None:
+        """Triggers update-independent state changes (gaze timeouts) once their deadline is reached"""
+
+        self.actor.submit(StateUpdate(state_loop_update=True))
+
+    def __on_gaze_target(self, target: GazeTarget, received_at: float) -> None:
+        self.actor.submit(StateUpdate(new_gaze_target=target), received_at)
+
+    def submit_gaze_target(self, target: GazeTarget, seq: int | None = None, sender: str | None = None, received_at: float | None = None) -> None:
+        """Logs every received gaze target, the state machine only gets the ones passing the gaze filter.
+
+        `received_at` (time.perf_counter()) of the request is carried through the filter, so the time from
+        receipt to transition includes the time the filter held the target.
+        """
+        if self.gaze_filter.offer(target, seq, sender, received_at):
+            self.logger.log_gaze_target(target.value)
+            self.live.publish("gaze_target", {"target": target.value})
+
+    def state(self) -> dict:
+        state = self.actor.sm.state
+        return {
+            "handover_state": state.current_handover_state.value,
+            "gaze_program": state.current_gaze_program.value,
+            "arm_location": state.last_arm_location.value,
+        }
+
+    def config(self) -> dict:
+        return {
+            "participant_identifier": self.participant_identifier,
+            "dynamic_gaze": self.dynamic_gaze,
+            "demonstration": self.demonstration,
+        }
+
+    def print_config(self) -> None:
+        print(f"[{self.session_id}] Identifier: {self.participant_identifier}")
+        print(f"[{self.session_id}] Dynamic Gaze: {self.dynamic_gaze}")
+        print(f"[{self.session_id}] Demonstration: {self.demonstration}")
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.notifier.start(loop)
+        self.actor.start()
+        self.scheduler.start(loop)
+        self.gaze_filter.start(loop)
+        self.print_config()
+
+    async def stop(self) -> None:
+        async with self.lock:
+            self.gaze_filter.stop()
+            # the pending handover events are still applied, logged, published and sent to the robot
+            await self.actor.stop()
+            self.scheduler.stop()
+            self.live.close()
+            await self.notifier.stop()
+            print(f"[{self.session_id}] Updates: {self.actor.latency_summary()}")
+            print(f"[{self.session_id}] Notifier: {self.notifier.metrics()}")
+            print(f"[{self.session_id}] Gaze Filter: {self.gaze_filter.summary()}")
+            print(f"[{self.session_id}] Dedupe: {self.dedupe.summary()}")
+            # blocks on the disk for up to seconds, the other sessions on the event loop keep running meanwhile
+            await asyncio.to_thread(self.logger.write_files)
+            await asyncio.to_thread(self.logger.close)
+
+    async def configure(self, participant_identifier: str | None, dynamic_gaze: bool | None, demonstration: bool | None) -> None:
+        async with self.lock:
+            if participant_identifier:
+                self.participant_identifier = participant_identifier
+
+            if dynamic_gaze is not None:
+                self.dynamic_gaze = dynamic_gaze
+
+            if demonstration is not None:
+                self.demonstration = demonstration
+
+            previous = self.logger.update_file_name(self.participant_identifier, self.dynamic_gaze, self.demonstration)
+            if previous:
+                # the new event log starts with a session record, from which a replay starts a fresh state
+                # machine, so the live one starts over as well; runs on the event loop, so the actor is never
+                # in the middle of an update here
+                self.actor.sm = StateMachine(logger=self.logger, dynamic_gaze=self.dynamic_gaze, policy=self.policy)
+                self.scheduler.rearm()
+            self.print_config()
+            if previous:
+                await asyncio.to_thread(self.logger.write_files, previous)
+
+    def file_name(self, participant_identifier: str | None = None, dynamic_gaze: bool | None = None, demonstration: bool | None = None) -> str:
+        """Base name of the session's output files, after a configure() with the given arguments"""
+
+        return DataLogger.create_base_file_name(
+            participant_identifier or self.participant_identifier,
+            self.dynamic_gaze if dynamic_gaze is None else dynamic_gaze,
+            self.demonstration if demonstration is None else demonstration,
+        )
+
+
+class SessionRegistry:
+    """Sessions of one server process keyed by session (workcell) id"""
+
+    def __init__(self):
+        self.sessions: Dict[str, Session] = {}
+        self.loop: asyncio.AbstractEventLoop | None = None
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+        for session in self.sessions.values():
+            session.start(loop)
+
+    async def stop(self) -> None:
+        for session_id in list(self.sessions.keys()):
+            await self.remove(session_id)
+
+    def get(self, session_id: str) -> Session | None:
+        return self.sessions.get(session_id)
+
+    def file_name_owner(self, file_name: str) -> str | None:
+        """Id of the session writing to the output files `file_name`, two sessions must never share them"""
+
+        for session_id, session in self.sessions.items():
+            if session.file_name() == file_name:
+                return session_id
+        return None
+
+    def add(self, session: Session) -> None:
+        """Sessions added before start() are started together with the registry"""
+
+        if session.session_id in self.sessions:
+            raise ValueError(f"session {session.session_id} already exists")
+        self.sessions[session.session_id] = session
+        if self.loop:
+            session.start(self.loop)
+
+    async def remove(self, session_id: str) -> None:
+        session = self.sessions.pop(session_id)
+        await session.stop()